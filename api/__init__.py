@@ -1,14 +1,20 @@
 import falcon
 
+import api.media
 import api.middleware
 import api.routes as routes
 
+from services.cognito import start_key_store
 from services.email_worker import start_email_worker
+from services.reference import start_reference_cache
 
 app = falcon.App(middleware=api.middleware.MIDDLEWARE)
+api.media.register(app)
 
 # Init routes
 routes.Routes(app)
 
 # Start any workers
+start_key_store()
 start_email_worker()
+start_reference_cache()
@@ -0,0 +1,14 @@
+from falcon import MEDIA_JSON
+from falcon.media import JSONHandler
+from services.encoding import dumps, loads
+
+json_handler = JSONHandler(dumps=dumps, loads=loads)
+
+
+def register(app):
+    """
+    Use the fast JSON handler for both request and response bodies
+    """
+
+    app.req_options.media_handlers[MEDIA_JSON] = json_handler
+    app.resp_options.media_handlers[MEDIA_JSON] = json_handler
@@ -9,5 +9,9 @@ class SQLAlchemySessionManager:
         resource.session = self.Session
 
     def process_response(self, req, resp, resource, req_succeeded):
+        # Streamed responses remove the session once they have been sent
+        if resp.context.get("streaming", False):
+            return
+
         if hasattr(resource, "session"):
             self.Session.remove()
@@ -1,3 +1,8 @@
+from itertools import chain
+
+from falcon import MEDIA_JSON
+from services.encoding import dumps
+from model import db
 from model.Contact import Contact
 from falcon.errors import (
     HTTPBadRequest,
@@ -6,6 +11,88 @@ from falcon.errors import (
 )
 
 
+class StreamedList:
+    """
+    Streams a query's results as a JSON array, validating and serialising them a
+    batch at a time so memory use doesn't grow with the size of the result.
+
+    The request's database session stays open while the response is streamed, and
+    is removed once the stream is finished or closed.
+    """
+
+    BATCH_SIZE = 200
+
+    def __init__(self, guard, method: str, rows, contact: Contact, fields: list):
+        self.guard = guard
+        self.method = method
+        self.rows = rows
+        self.contact = contact
+        self.fields = fields
+
+    def __iter__(self):
+        try:
+            yield b"["
+
+            first = True
+            batch = []
+            for o in self.rows:
+                batch.append(o)
+                if len(batch) < self.BATCH_SIZE:
+                    continue
+
+                chunk = self.encode(batch, first)
+                if chunk:
+                    first = False
+                    yield chunk
+                batch = []
+
+            chunk = self.encode(batch, first)
+            if chunk:
+                yield chunk
+
+            yield b"]"
+        finally:
+            self.close()
+
+    def encode(self, batch: list, first: bool) -> bytes:
+        items = self.guard.validate_many(self.method, batch, self.contact, self.fields)
+        if len(items) < 1:
+            return b""
+
+        chunk = b",".join(dumps(i) for i in items)
+        if not first:
+            chunk = b"," + chunk
+
+        return chunk
+
+    def close(self):
+        db.remove()
+
+
+def response_fields(req, resp) -> list:
+    """
+    The fields to output for a request. Clients can narrow the fields a resource
+    chose with resp.context.fields, but not ask for any others.
+    """
+
+    requested = req.context.get("fields") or []
+    chosen = resp.context.get("fields") or []
+
+    if len(requested) < 1:
+        return chosen
+
+    if len(chosen) < 1:
+        return requested
+
+    unavailable = [f for f in requested if f not in chosen]
+    if len(unavailable) > 0:
+        raise HTTPBadRequest(
+            description=f"Unavailable fields: {', '.join(unavailable)}"
+        )
+
+    return requested
+
+
 class GuardMiddleware:
     def validate(self, method: str, single_obj, contact: Contact = None, fields=[]):
         """
@@ -26,6 +113,50 @@ class GuardMiddleware:
             if attribute(contact) == False:
                 return rv
 
+        return self.serialize(single_obj, contact, fields)
+
+    def validate_many(
+        self, method: str, objects: list, contact: Contact = None, fields=[]
+    ):
+        """
+        Validate a list of objects, returning only those which are allowed.
+
+        Models can decide for a whole list at once by defining a class level
+        `<method>_many(objects, user)` which returns a list of booleans; any
+        others are validated one by one.
+        """
+
+        groups = {}
+        for i, o in enumerate(objects):
+            groups.setdefault(type(o), []).append(i)
+
+        allowed = [None] * len(objects)
+        for cls, indices in groups.items():
+            guard_many = getattr(cls, f"{method}_many", None)
+            if not callable(guard_many):
+                continue
+
+            results = guard_many([objects[i] for i in indices], contact)
+            for i, result in zip(indices, results):
+                allowed[i] = result
+
+        rv = []
+        for o, result in zip(objects, allowed):
+            if result is None:
+                v = self.validate(method, o, contact, fields)
+            elif result:
+                v = self.serialize(o, contact, fields)
+            else:
+                continue
+
+            if v != False:
+                rv.append(v)
+
+        return rv
+
+    def serialize(self, single_obj, contact: Contact = None, fields=[]):
+        rv = False
+
         if hasattr(single_obj, "__schema__"):
             if callable(single_obj.__schema__):
                 rv = single_obj.__schema__().toDict(contact, fields)
@@ -34,6 +165,41 @@ class GuardMiddleware:
 
         return rv
 
+    def requested_fields(self, fields: list, obj):
+        """
+        Check the fields a client asked for with ?fields= are all in the schema of
+        the object (or the first object in a list) being returned
+        """
+
+        if isinstance(obj, list):
+            if len(obj) < 1:
+                return fields
+            obj = obj[0]
+
+        schema = getattr(obj, "__schema__", None)
+        if callable(schema):
+            schema = schema()
+
+        if schema is None:
+            return fields
+
+        unknown = [f for f in fields if f not in schema.field_names]
+        if len(unknown) > 0:
+            raise HTTPBadRequest(description=f"Unknown fields: {', '.join(unknown)}")
+
+        return fields
+
+    def process_request(self, req, resp):
+        """
+        Clients can ask for a subset of fields with ?fields=a,b,c
+        """
+
+        fields = []
+        for value in req.get_param_as_list("fields") or []:
+            fields.extend(f.strip() for f in value.split(",") if f.strip() != "")
+
+        req.context.fields = fields
+
     def process_response(self, req, resp, resource, req_succeeded):
         if not req_succeeded:
             return
@@ -64,17 +230,28 @@ class GuardMiddleware:
         # Get action method string
         method_string = action.lower() + "_guard"
 
-        fields = []
-        if "fields" in resp.context:
-            fields = resp.context.fields
+        fields = response_fields(req, resp)
+
+        # Large results can be streamed by returning a query rather than a list.
+        # The first row is read now, so the fields can be checked against it.
+        if resp.context.get("stream", False):
+            rows = iter(obj.yield_per(StreamedList.BATCH_SIZE))
+            first = next(rows, None)
+            if first is not None:
+                if len(req.context.fields) > 0:
+                    self.requested_fields(fields, first)
+                rows = chain([first], rows)
+
+            resp.content_type = MEDIA_JSON
+            resp.stream = StreamedList(self, method_string, rows, contact, fields)
+            resp.context.streaming = True
+            return
+
+        if len(req.context.fields) > 0:
+            self.requested_fields(fields, obj)
 
         if isinstance(obj, list):
-            new_list = filter(
-                lambda i: i != False,
-                map(lambda o: self.validate(method_string, o, contact, fields), obj),
-            )
-            new_list = list(new_list)
-            resp.media = new_list
+            resp.media = self.validate_many(method_string, obj, contact, fields)
             return
 
         obj = self.validate(method_string, obj, contact=contact, fields=fields)
@@ -1,8 +1,16 @@
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta
 
 from blake3 import blake3
 from falcon.errors import HTTPUnauthorized
-from services.cognito import validate_token
+from sqlalchemy import event
+from sqlalchemy.orm import make_transient_to_detached
+from model import db
+from model.Contact import Contact, UserIdentity
+from services.cognito import decode_token, get_token_contact
+from services.permissions import get_principal
 from settings import config
 
 SK = config.get("default", "secret")
@@ -10,6 +18,88 @@ ENV = config.get("default", "env")
 BEARER = "Bearer "
 
 
+class TokenCache:
+    """
+    Bounded LRU cache of access tokens which have already been verified.
+
+    Entries are keyed on a digest of the raw token, hold its claims and the id of
+    the linked contact, and are dropped when the token expires. Other processes
+    can delete the contact without this one hearing of it, so an entry is only
+    trusted for `recheck` seconds after the contact was last seen to exist.
+    """
+
+    def __init__(self, size: int = 1024, recheck: int = 30):
+        self.size = size
+        self.recheck = recheck
+        self.hits = 0
+        self.misses = 0
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def digest(access_token: str) -> bytes:
+        return blake3(access_token.encode()).digest()
+
+    def get(self, access_token: str):
+        """
+        Return (claims, contact_id, checked_at) for a token we have verified, or
+        None
+        """
+
+        key = self.digest(access_token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0]["exp"] <= time.time():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, access_token: str, claims: dict, contact_id: int):
+        key = self.digest(access_token)
+        with self._lock:
+            self._entries[key] = (claims, contact_id, time.time())
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, sub: str = None, contact_id: int = None):
+        """
+        Forget every token issued to an identity, or linked to a contact
+        """
+
+        with self._lock:
+            for key, (claims, cid, _) in list(self._entries.items()):
+                if claims["sub"] == sub or (
+                    contact_id is not None and cid == contact_id
+                ):
+                    del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+token_cache = TokenCache()
+
+
+@event.listens_for(UserIdentity, "after_update")
+@event.listens_for(UserIdentity, "after_delete")
+def identity_changed(mapper, connection, identity):
+    token_cache.invalidate(sub=identity.id)
+
+
+@event.listens_for(Contact, "after_delete")
+def contact_deleted(mapper, connection, contact):
+    token_cache.invalidate(contact_id=contact.id)
+
+
 class SessionManager:
     def process_request(self, req, resp):
         """
@@ -25,12 +115,57 @@ class SessionManager:
 
         try:
             access_token = access_token.split(" ")[-1]
-            contact = validate_token(access_token)
+            claims, contact = self.authenticate(access_token)
         except Exception as e:
             print(str(e))
             raise HTTPUnauthorized
 
+        req.context.claims = claims
         req.context.user = contact
+        req.context.principal = get_principal(contact)
+
+    def authenticate(self, access_token: str):
+        """
+        Return the claims and contact for a token, only verifying it if it is not
+        already in the token cache
+        """
+
+        cached = token_cache.get(access_token)
+        if cached is not None:
+            claims, contact_id, checked_at = cached
+            if time.time() - checked_at < token_cache.recheck:
+                return claims, self.cached_contact(contact_id)
+
+            contact = db.get(Contact, contact_id)
+            if contact is not None:
+                token_cache.put(access_token, claims, contact_id)
+                return claims, contact
+
+            token_cache.invalidate(contact_id=contact_id)
+
+        claims = decode_token(access_token)
+        contact = get_token_contact(claims)
+        if contact is None:
+            # Not linked to a contact, so there is nothing worth caching
+            return claims, None
+
+        token_cache.put(access_token, claims, contact.id)
+
+        return claims, contact
+
+    @staticmethod
+    def cached_contact(contact_id: int) -> Contact:
+        """
+        Attach the contact for a cached token to this request's session without
+        querying for it. Its columns are loaded together the first time one is
+        read.
+        """
+
+        contact = Contact()
+        contact.id = contact_id
+        make_transient_to_detached(contact)
+
+        return db.merge(contact, load=False)
 
     def process_response(self, req, resp, resource, req_succeeded):
         """
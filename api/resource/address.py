@@ -1,14 +1,67 @@
+import math
 from datetime import datetime
-from sqlalchemy.sql.expression import func
+from sqlalchemy.orm import selectinload
+from sqlalchemy.sql.expression import func, or_
 from falcon.errors import HTTPNotFound, HTTPBadRequest, HTTPForbidden
-from model.Address import Address, AddressNote, Postcode, Street, SurveyReturn
+from model.Address import (
+    GRID_COLUMNS,
+    GRID_SIZE,
+    Address,
+    AddressBoundary,
+    AddressNote,
+    Street,
+    SurveyReturn,
+)
 from model.Contact import Contact
+from api.middleware.guard import response_fields
+from model.Loaders import query_options
 from services.permissions import trusted_user
+from services.reference import reference
+from services.stats import record_return
 
 
-def distance(latlong1, latlong2):
-    return func.sqrt(
-        func.pow(latlong1[0] - latlong2[0], 2) + func.pow(latlong1[1] - latlong2[1], 2)
+# Mean radius of the earth, in metres
+EARTH_RADIUS = 6371008.8
+
+# Default and largest distance (in metres) for ?near= searches
+NEAR_RADIUS = 35
+MAX_NEAR_RADIUS = 1000
+
+
+def haversine(lat, long, latitude, longitude):
+    """
+    Great circle distance in metres from a point to a latitude and longitude column
+    """
+
+    a = func.power(func.sin(func.radians(latitude - lat) / 2), 2) + math.cos(
+        math.radians(lat)
+    ) * func.cos(func.radians(latitude)) * func.power(
+        func.sin(func.radians(longitude - long) / 2), 2
+    )
+    return 2 * EARTH_RADIUS * func.asin(func.sqrt(a))
+
+
+def grid_cells(lat, long, radius):
+    """
+    Filter addresses to the grid cells covering a radius (in metres) around a
+    point, as a range of cells for each row of the grid
+    """
+
+    d_lat = math.degrees(radius / EARTH_RADIUS)
+    d_long = d_lat / max(math.cos(math.radians(lat)), 0.01)
+
+    rows = range(
+        math.floor((lat - d_lat + 90) / GRID_SIZE),
+        math.floor((lat + d_lat + 90) / GRID_SIZE) + 1,
+    )
+    first = math.floor((long - d_long + 180) / GRID_SIZE)
+    last = math.floor((long + d_long + 180) / GRID_SIZE)
+
+    return or_(
+        *[
+            Address.grid_cell.between(r * GRID_COLUMNS + first, r * GRID_COLUMNS + last)
+            for r in rows
+        ]
     )
 
 
@@ -17,12 +70,24 @@ class AddressResource:
 
         params = req.params
 
-        if len(params) < 1:
+        if len([p for p in params if p != "fields"]) < 1:
             raise HTTPBadRequest(
                 description="There are a lot of addresses, you must provide a search query."
             )
 
-        addr = self.session.query(Address)
+        resp.context.fields = [
+            "uprn",
+            "single_line",
+            "street_id",
+            "classification",
+            "last_visit",
+        ]
+
+        addr = (
+            self.session.query(Address)
+            .options(*query_options(Address, response_fields(req, resp)))
+            .filter(Address.retired_on == None)
+        )
 
         try:
             trusted_user(req.context.user)
@@ -33,12 +98,13 @@ class AddressResource:
         if "all" not in params or not tu:
             addr = addr.filter(Address.classification_code.startswith("R"))
 
+        limit = 100
+
         for p in params:
             if p == "postcode":
                 pc = str(params[p]).upper()
 
-                postcode = self.session.query(Postcode).get(pc)
-                if postcode is None:
+                if not reference.postcode_exists(pc):
                     raise HTTPNotFound(description="That postcode does not exist")
                 addr = addr.filter(Address.postcode == pc)
 
@@ -54,16 +120,37 @@ class AddressResource:
 
                 addr = addr.filter(Address.usrn == usrn)
 
-            if p == "near":
-                lat, long = str(params[p]).split(",", 1)
-                lat, long = float(lat), float(long)
-                position = (lat, long)
-                bounds = ((lat - 0.0003, lat + 0.0003), (long - 0.0003, long + 0.0003))
+            if p == "boundary":
+                code = str(params[p]).upper()
+                if reference.boundary(code) is None:
+                    raise HTTPNotFound(description="That boundary does not exist")
+
+                addr = addr.join(
+                    AddressBoundary, AddressBoundary.uprn == Address.uprn
+                ).filter(AddressBoundary.boundary_code == code)
 
+            if p == "near":
+                try:
+                    lat, long = str(params[p]).split(",", 1)
+                    lat, long = float(lat), float(long)
+                    radius = float(params.get("radius", NEAR_RADIUS))
+                    limit = max(min(int(params.get("k", limit)), limit), 1)
+                except ValueError:
+                    raise HTTPBadRequest(
+                        description="Near must be a latitude and longitude, radius a number of metres and k a number of addresses"
+                    )
+                if not (-90 <= lat <= 90 and -180 <= long <= 180):
+                    raise HTTPBadRequest(description="Near must be on the earth")
+                if not 0 <= radius <= MAX_NEAR_RADIUS:
+                    raise HTTPBadRequest(
+                        description=f"Radius must be between 0 and {MAX_NEAR_RADIUS} metres"
+                    )
+
+                distance = haversine(lat, long, Address.latitude, Address.longitude)
                 addr = (
-                    addr.filter(Address.latitude.between(bounds[0][0], bounds[0][1]))
-                    .filter(Address.longitude.between(bounds[1][0], bounds[1][1]))
-                    .order_by(distance(position, (Address.latitude, Address.longitude)))
+                    addr.filter(grid_cells(lat, long, radius))
+                    .filter(distance <= radius)
+                    .order_by(distance)
                 )
 
         addr = (
@@ -75,20 +162,17 @@ class AddressResource:
                 Address.pao_text,
                 Address.sao_text,
             )
-            .limit(100)
+            .limit(limit)
             .all()
         )
         resp.context.media = addr
-        resp.context.fields = [
-            "uprn",
-            "single_line",
-            "street_id",
-            "classification",
-            "last_visit",
-        ]
 
     def on_get_single(self, req, resp, uprn):
-        addr = self.session.query(Address).get(uprn)
+        addr = (
+            self.session.query(Address)
+            .options(*query_options(Address, req.context.fields))
+            .get(uprn)
+        )
 
         if addr is None:
             raise HTTPNotFound
@@ -214,6 +298,7 @@ class AddressResource:
             response.response_3 = str(input["hmo"])[0]
 
         self.session.add(response)
+        record_return(response)
         self.session.commit()
 
         resp.status = 201
@@ -239,11 +324,17 @@ class StreetResource:
 
         query = req.params["q"].upper()
 
+        # Streets with a word similar to the query (the %> operator uses the
+        # trigram index), most similar first
         streets = (
             self.session.query(Street)
-            .filter(Street.description.like(f"%{query}%"))
+            .filter(Street.search_text.op("%>")(query))
             .filter(Street.households > 0)
-            .order_by(Street.description)
+            .options(selectinload(Street.summaries))
+            .order_by(
+                func.word_similarity(query, Street.search_text).desc(),
+                Street.description,
+            )
             .limit(15)
             .all()
         )
@@ -14,6 +14,8 @@ from model.Contact import (
     Note,
     TelephoneNumber,
 )
+from api.middleware.guard import response_fields
+from model.Loaders import query_options
 from services.email import EmailService
 from services.permissions import RoleTypes, trusted_user, user_has_role
 from services.sms import SmsService
@@ -27,12 +29,23 @@ class ContactsResource:
 
         q = req.params
 
-        if len(q) < 1:
+        if len([p for p in q if p != "fields"]) < 1:
             raise HTTPBadRequest(
                 description="There are a lot of contacts, you must provide a search query."
             )
 
-        contacts_qry = self.session.query(Contact)
+        resp.context.fields = [
+            "id",
+            "name",
+            "legal_name",
+            "membership_number",
+            "membership_status",
+            "avatar_url",
+        ]
+
+        contacts_qry = self.session.query(Contact).options(
+            *query_options(Contact, response_fields(req, resp))
+        )
 
         limit = 0
 
@@ -61,14 +74,6 @@ class ContactsResource:
         )
 
         resp.context.media = contacts
-        resp.context.fields = [
-            "id",
-            "name",
-            "legal_name",
-            "membership_number",
-            "membership_status",
-            "avatar_url",
-        ]
 
     def on_post_collection(self, req, resp):
         """
@@ -122,7 +127,11 @@ class ContactsResource:
         except:
             raise HTTPBadRequest(description="The contact ID provided was invalid.")
 
-        contact = self.session.query(Contact).get(id)
+        contact = (
+            self.session.query(Contact)
+            .options(*query_options(Contact, req.context.fields))
+            .get(id)
+        )
         if contact is None:
             raise HTTPNotFound
 
@@ -1,7 +1,13 @@
 from datetime import date, datetime
 from dateutil import relativedelta
+from model.Address import Address
+from model.Contact import Contact, ContactAddress
+from api.middleware.guard import response_fields
+from model.Loaders import query_options
 from model.Organisation import Branch, BranchArea, Committee, Role, RoleTypes
+from services.organisation import assign_branches
 from services.permissions import InvalidPermissionError, user_has_role
+from services.reference import reference
 from falcon.errors import HTTPForbidden, HTTPBadRequest, HTTPNotFound
 from falcon import HTTP_201, HTTP_204
 
@@ -12,22 +18,62 @@ class BranchResource:
         Get a list of all branches
         """
 
-        branches = self.session.query(Branch).all()
+        resp.context.fields = ["id", "formal_name", "members"]
+
+        branches = (
+            self.session.query(Branch)
+            .options(*query_options(Branch, response_fields(req, resp)))
+            .all()
+        )
 
         resp.context.media = branches
-        resp.context.fields = ["id", "formal_name", "members"]
 
     def on_get_single(self, req, resp, branch_id):
         """
         Get a branch
         """
 
-        branch: Branch = self.session.query(Branch).get(branch_id)
+        branch: Branch = (
+            self.session.query(Branch)
+            .options(*query_options(Branch, req.context.fields))
+            .get(branch_id)
+        )
         if branch is None:
             raise HTTPNotFound
 
         resp.context.media = branch
 
+    def on_get_contacts(self, req, resp, branch_id):
+        """
+        Export the members of a branch. This can be a long list so it is streamed.
+        """
+
+        branch: Branch = self.session.query(Branch).get(branch_id)
+        if branch is None:
+            raise HTTPNotFound
+
+        resp.context.fields = [
+            "id",
+            "name",
+            "legal_name",
+            "membership_number",
+            "membership_status",
+            "addresses",
+        ]
+
+        contacts = (
+            self.session.query(Contact)
+            .join(ContactAddress, Contact.lives_at == ContactAddress.id)
+            .join(Address, ContactAddress.uprn == Address.uprn)
+            .filter(Contact.membership_number != None)
+            .filter(Address.branch_id == branch.id)
+            .options(*query_options(Contact, response_fields(req, resp)))
+            .order_by(Contact.family_name, Contact.given_name)
+        )
+
+        resp.context.media = contacts
+        resp.context.stream = True
+
     def on_post(self, req, resp):
         """
         Create a new branch
@@ -69,6 +115,9 @@ class BranchResource:
                 self.session.add(area)
 
             self.session.commit()
+            assign_branches([a.postcode for a in new_branch.areas])
+
+        reference.invalidate("branches")
 
         resp.context.media = new_branch
         resp.status = HTTP_201
@@ -108,16 +157,23 @@ class BranchResource:
             if not isinstance(postcodes, list):
                 raise HTTPBadRequest(description="Postcodes must be a list")
 
+            # Addresses in both the old and new areas may change branch
+            changed = set()
             for a in branch.areas:
+                changed.add(a.postcode)
                 self.session.delete(a)
 
             for pc in postcodes:
                 area = BranchArea()
                 area.branch = branch
                 area.postcode = str(pc).upper().strip()
+                changed.add(area.postcode)
                 self.session.add(area)
 
             self.session.commit()
+            assign_branches(changed)
+
+        reference.invalidate("branches")
 
         resp.context.media = branch
 
@@ -152,10 +208,15 @@ class CommitteeResource:
         Get a list of all committees
         """
 
-        committees = self.session.query(Committee).all()
+        resp.context.fields = ["id", "abbreviation", "name"]
+
+        committees = (
+            self.session.query(Committee)
+            .options(*query_options(Committee, response_fields(req, resp)))
+            .all()
+        )
 
         resp.context.media = committees
-        resp.context.fields = ["id", "abbreviation", "name"]
 
     def on_post(self, req, resp):
         """
@@ -188,7 +249,11 @@ class CommitteeResource:
         Get a single committee
         """
 
-        committee = self.session.query(Committee).get(committee_id)
+        committee = (
+            self.session.query(Committee)
+            .options(*query_options(Committee, req.context.fields))
+            .get(committee_id)
+        )
         if committee is None:
             raise HTTPNotFound
         resp.context.media = committee
@@ -0,0 +1,37 @@
+from falcon.errors import HTTPForbidden, HTTPNotFound
+from model.Stats import BoundaryStats, BranchStats
+from services.permissions import trusted_user
+
+
+class StatsResource:
+    def on_get_boundary(self, req, resp, code):
+        """
+        Get the statistics of a boundary (e.g. a ward or constituency)
+        """
+
+        try:
+            trusted_user(req.context.user)
+        except:
+            raise HTTPForbidden
+
+        stats = self.session.query(BoundaryStats).get(str(code).upper())
+        if stats is None:
+            raise HTTPNotFound
+
+        resp.context.media = stats
+
+    def on_get_branch(self, req, resp, branch_id):
+        """
+        Get the statistics of a branch
+        """
+
+        try:
+            trusted_user(req.context.user)
+        except:
+            raise HTTPForbidden
+
+        stats = self.session.query(BranchStats).get(branch_id)
+        if stats is None:
+            raise HTTPNotFound
+
+        resp.context.media = stats
@@ -4,6 +4,7 @@ import api.resource.content as content
 import api.resource.membership as membership
 import api.resource.organisation as org
 import api.resource.root as root
+import api.resource.stats as stats
 
 
 class Routes:
@@ -84,6 +85,9 @@ class Routes:
         # Organisation
         app.add_route("/branches", org.BranchResource())
         app.add_route("/branches/{branch_id}", org.BranchResource(), suffix="single")
+        app.add_route(
+            "/branches/{branch_id}/contacts", org.BranchResource(), suffix="contacts"
+        )
         app.add_route("/committees", org.CommitteeResource())
         app.add_route(
             "/committees/{committee_id}", org.CommitteeResource(), suffix="single"
@@ -92,3 +96,11 @@ class Routes:
         app.add_route(
             "/contact/{id}/role/{role_id}", org.RoleResource(), suffix="single"
         )
+
+        # Statistics
+        app.add_route(
+            "/stats/boundaries/{code}", stats.StatsResource(), suffix="boundary"
+        )
+        app.add_route(
+            "/stats/branches/{branch_id}", stats.StatsResource(), suffix="branch"
+        )
@@ -1,16 +1,74 @@
-from services.address import AddressImportService
+import pandas as pd
+from sqlalchemy.orm import joinedload
+from services.address import AddressImportService, format_addresses
+from model.Address import Address
 from model.Organisation import Branch
 from model import db
 
 
-def download():
+def download(release=None):
     ais = AddressImportService()
-    ais.download_data()
+    ais.download_data(release)
 
 
-def do_import():
+def do_import(bulk=False, release=None, workers=1):
+    ais = AddressImportService(workers)
+    ais.import_addresses(bulk, release)
+
+
+def do_import_changes(release):
+    ais = AddressImportService()
+    ais.import_changes(release)
+
+
+def refresh_display():
     ais = AddressImportService()
-    ais.import_addresses()
+    return ais.refresh_display()
+
+
+def check_display(limit=1000):
+    """
+    Check the text computed for addresses at import matches what the Address
+    model formats, returning the number checked and a list of any which differ
+    """
+
+    addresses = (
+        db.query(Address)
+        .options(joinedload(Address.street))
+        .filter(Address.usrn != None)
+        .limit(limit)
+        .all()
+    )
+
+    columns = [c.name for c in Address.__table__.columns]
+    frame = pd.DataFrame([{c: getattr(a, c) for c in columns} for a in addresses])
+    streets = pd.DataFrame(
+        [
+            {
+                "usrn": s.usrn,
+                "description": s.description,
+                "locality": s.locality,
+                "town": s.town,
+                "admin_area": s.admin_area,
+            }
+            for s in {a.street for a in addresses if a.street is not None}
+        ]
+    )
+    formatted = format_addresses(frame, streets)
+
+    mismatches = []
+    for a, single_line, multiline in zip(
+        addresses, formatted["single_line"], formatted["multiline"]
+    ):
+        if a.street is None or a.street.description is None:
+            continue
+
+        expected = (a.format_single_line(), a.format_multiline())
+        if (single_line, multiline) != expected:
+            mismatches.append((a.uprn, (single_line, multiline), expected))
+
+    db.remove()
+    return len(addresses), mismatches
 
 
 def get_branch_members_from_id(branch_id):
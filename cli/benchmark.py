@@ -0,0 +1,127 @@
+"""
+Benchmarks which run against the configured database
+"""
+import json
+import time
+import tracemalloc
+
+import model.Schema
+from model import db
+from model.Address import Address
+from model.Contact import Contact
+from services import encoding
+from services.address import AddressImportService
+
+
+def serialize(obj, user=None, fields=[]):
+    schema = obj.__schema__
+    if callable(schema):
+        schema = schema()
+
+    return schema.toDict(user, fields)
+
+
+def schema(limit=100, repeat=10, cold=False):
+    """
+    Time how long it takes to serialise an Address and a Contact, in microseconds
+    per object. If cold is True the compiled schema plans are thrown away before
+    every object.
+    """
+
+    results = []
+
+    for cls in (Address, Contact):
+        objects = db.query(cls).limit(limit).all()
+        if len(objects) < 1:
+            continue
+
+        # Serialise everything once so lazy loads aren't included in the timings
+        for o in objects:
+            serialize(o)
+
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for o in objects:
+                if cold:
+                    model.Schema._plans.clear()
+                serialize(o)
+        elapsed = time.perf_counter() - start
+
+        results.append((cls.__name__, elapsed / (repeat * len(objects)) * 1e6))
+
+    db.remove()
+    return results
+
+
+def encode(limit=100, repeat=100):
+    """
+    Time how long it takes to encode the payload for a list of addresses with the
+    standard library encoder and with the one the API uses, in microseconds per
+    payload
+    """
+
+    payload = [serialize(a) for a in db.query(Address).limit(limit).all()]
+    db.remove()
+
+    results = []
+    for name, dumps in (
+        ("json", lambda p: json.dumps(p, default=str)),
+        ("orjson", encoding.dumps),
+    ):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            dumps(payload)
+        elapsed = time.perf_counter() - start
+
+        results.append((name, elapsed / repeat * 1e6))
+
+    return len(payload), results
+
+
+def parse_memory(chunk_size=250000):
+    """
+    Measure the peak memory and time taken to parse the extracted address data,
+    reading each CSV whole and then a chunk at a time
+    """
+
+    results = []
+
+    for label, size in (
+        ("whole files", None),
+        (f"{chunk_size} row chunks", chunk_size),
+    ):
+        ais = AddressImportService()
+        ais.CHUNK_SIZE = size
+
+        tracemalloc.start()
+        start = time.perf_counter()
+        data = ais.parse_data()
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        results.append((label, len(data.addresses.index), peak / 2 ** 20, elapsed))
+
+    return results
+
+
+def transform(workers=4):
+    """
+    Time parsing the extracted address data and encoding the addresses for
+    COPY, with one worker process and with `workers`
+    """
+
+    results = []
+
+    for count in (1, workers):
+        ais = AddressImportService(count)
+
+        start = time.perf_counter()
+        data = ais.parse_data()
+        for _ in ais.encode(data.addresses):
+            pass
+        elapsed = time.perf_counter() - start
+
+        results.append((count, len(data.addresses.index), elapsed))
+
+    return results
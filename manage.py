@@ -1,6 +1,7 @@
 import click
 from cli.contacts import create_contact, set_password, import_from_stripe
-from cli import address
+from cli import address, benchmark
+from services import stats
 from model.File import File
 
 
@@ -15,13 +16,68 @@ def test():
 
 
 @cli.command()
-def import_addr():
+@click.option("--bulk", is_flag=True, help="Load with COPY and set-based upserts")
+@click.option(
+    "--incremental", is_flag=True, help="Apply the change-only update for a release"
+)
+@click.option(
+    "--release",
+    type=click.DateTime(formats=["%Y-%m-%d"]),
+    help="The AddressBase release date, e.g. 2022-08-01",
+)
+@click.option(
+    "--workers", default=1, help="Processes to merge and encode addresses with"
+)
+def import_addr(bulk, incremental, release, workers):
+    if release is not None:
+        release = release.date()
+
+    if incremental and release is None:
+        raise click.UsageError("--incremental needs a --release")
+
     click.echo("Downloading data...")
-    address.download()
+    address.download(release if incremental else None)
 
     click.echo(click.style("Download complete", fg="green"))
+    if incremental:
+        click.echo(f"Applying changes from {release.isoformat()}")
+        address.do_import_changes(release)
+        return
+
     click.echo("Importing (this may take a while!")
-    address.do_import()
+    address.do_import(bulk, release, workers)
+
+
+@cli.command()
+def refresh_addr_text():
+    """
+    Store the text of any addresses which don't have it
+    """
+    click.echo(f"Refreshed {address.refresh_display()} addresses")
+
+
+@cli.command()
+@click.option("--limit", default=1000, help="Number of addresses to check")
+def check_addr_text(limit):
+    """
+    Check the address text computed at import matches the Address model
+    """
+    checked, mismatches = address.check_display(limit)
+    for uprn, got, expected in mismatches:
+        click.echo(f"{uprn}: {got} != {expected}")
+
+    colour = "red" if len(mismatches) > 0 else "green"
+    click.echo(
+        click.style(f"{len(mismatches)} of {checked} addresses differ", fg=colour)
+    )
+
+
+@cli.command()
+def refresh_stats():
+    """
+    Recompute the statistics of every boundary and branch
+    """
+    click.echo(f"Refreshed {stats.refresh_stats()} boundaries and branches")
 
 
 @cli.command()
@@ -45,5 +101,55 @@ def add_contact(given_name, family_name, email):
     click.echo("Contact added to database")
 
 
+@cli.command()
+@click.option("--limit", default=100, help="Number of objects of each type")
+@click.option("--repeat", default=10)
+@click.option("--cold", is_flag=True, help="Recompile schema plans for every object")
+def bench_schema(limit, repeat, cold):
+    """
+    Time the serialisation of addresses and contacts
+    """
+    for name, per_object in benchmark.schema(limit, repeat, cold):
+        click.echo(f"{name.ljust(15)} {per_object:.1f} µs/object")
+
+
+@cli.command()
+@click.option("--limit", default=100, help="Number of addresses in the payload")
+@click.option("--repeat", default=100)
+def bench_encode(limit, repeat):
+    """
+    Time the JSON encoding of a list of addresses
+    """
+    count, results = benchmark.encode(limit, repeat)
+    for name, per_payload in results:
+        click.echo(f"{name.ljust(15)} {per_payload:.1f} µs/{count} addresses")
+
+
+@cli.command()
+@click.option("--chunk-size", default=250000, help="Rows of each CSV to read at a time")
+def bench_parse(chunk_size):
+    """
+    Measure the peak memory used parsing the downloaded address data
+    """
+    for label, rows, peak, elapsed in benchmark.parse_memory(chunk_size):
+        click.echo(
+            f"{label.ljust(20)} {rows} addresses, peak {peak:.1f} MiB, {elapsed:.1f}s"
+        )
+
+
+@cli.command()
+@click.option("--workers", default=4, help="Processes to compare with one")
+def bench_transform(workers):
+    """
+    Compare the throughput of merging and encoding the downloaded addresses in
+    one process and in several
+    """
+    for count, rows, elapsed in benchmark.transform(workers):
+        click.echo(
+            f"{count} worker(s)".ljust(15)
+            + f"{rows} addresses in {elapsed:.1f}s ({rows / elapsed:.0f} rows/s)"
+        )
+
+
 if __name__ == "__main__":
     cli()
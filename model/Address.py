@@ -1,16 +1,39 @@
 from enum import Enum
 
-from services.permissions import trusted_user, user_has_role
-from sqlalchemy import BigInteger, Boolean, Column, Date, text
+from services.permissions import e2b, trusted_user, user_has_role
+from sqlalchemy import BigInteger, Boolean, Column, Computed, Date, DateTime, text
 from sqlalchemy import Enum as EnumColumn
-from sqlalchemy import Float, ForeignKey, Integer, String, Text
+from sqlalchemy import Float, ForeignKey, Index, Integer, String, Text
+from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy.orm import backref, relationship, column_property
 from sqlalchemy.sql.expression import func, select
 
 from model import Model, db
 from model.Organisation import BranchArea, Branch
 
-from .Schema import Schema
+from .Loaders import latest
+from .Schema import Deferred, Schema
+
+# Addresses are indexed on the cell of a GRID_SIZE degree grid they fall in, each
+# row of the grid numbering GRID_COLUMNS cells (see Address.grid_cell)
+GRID_SIZE = 0.001
+GRID_COLUMNS = 360000
+
+# What an address's text is formatted from, when it isn't stored yet
+DISPLAY_FIELDS = (
+    "sao_text",
+    "sao_start_number",
+    "sao_start_suffix",
+    "sao_end_number",
+    "sao_end_suffix",
+    "pao_text",
+    "pao_start_number",
+    "pao_start_suffix",
+    "pao_end_number",
+    "pao_end_suffix",
+    "postcode",
+    "street",
+)
 
 
 class Address(Model):
@@ -55,13 +78,33 @@ class Address(Model):
     classification_code = Column(
         String(length=6), ForeignKey("classifications.code", ondelete="CASCADE")
     )
+    # The grid cell the address is in, so addresses near a point can be found
+    # with a few index range scans
+    grid_cell = Column(
+        BigInteger,
+        Computed(
+            f"(floor((latitude + 90) / {GRID_SIZE}) * {GRID_COLUMNS} "
+            + f"+ floor((longitude + 180) / {GRID_SIZE}))::bigint"
+        ),
+        index=True,
+    )
+
+    # The address as text, stored so that listing addresses doesn't need their
+    # streets. Computed at import; see format_single_line and format_multiline.
+    _single_line = Column("single_line", Text, nullable=True)
+    _multiline = Column("multiline", ARRAY(Text), nullable=True)
 
-    branch_id = column_property(
-        select([BranchArea.branch_id.label("branch_id")])
-        .where(text("addresses.postcode LIKE branch_areas.postcode || '%'"))
-        .order_by(func.length(BranchArea.postcode).desc())
-        .limit(1)
-        .as_scalar()
+    # Set when AddressBase retires the address. Retired addresses are kept so
+    # their canvassing history isn't lost, but they are left out of searches.
+    retired_on = Column(Date, nullable=True)
+
+    # The branch whose area has the longest postcode prefix matching the address.
+    # Kept up to date by services.organisation.assign_branches.
+    branch_id = Column(
+        Integer,
+        ForeignKey("branches.id", ondelete="SET NULL", onupdate="CASCADE"),
+        index=True,
+        nullable=True,
     )
 
     # Relationships
@@ -72,41 +115,40 @@ class Address(Model):
         "Address", remote_side=[parent_uprn], back_populates="parent"
     )
     classification = relationship("Classification", back_populates="addresses")
+    branch = relationship(Branch)
 
     boundaries = relationship(
         "Boundary",
         backref="addresses",
-        secondary="postcodes",
-        primaryjoin="Address.postcode == foreign(Postcode.pcds)",
-        secondaryjoin="foreign(Boundary.code.in_((Postcode.e05, "
-        + "Postcode.e06, "
-        + "Postcode.e07, "
-        + "Postcode.e10, "
-        + "Postcode.e14, "
-        + "Postcode.e47, "
-        + "Postcode.e58)))",
+        secondary="address_boundaries",
         order_by="Boundary.code.desc()",
         viewonly=True,
     )
 
-    @property
-    def branch(self):
-        return db.query(Branch).get(self.branch_id)
+    # What needs loading to output each schema field (see model.Loaders)
+    __loaders__ = {
+        "uprn": ("uprn",),
+        "single_line": ("_single_line", *DISPLAY_FIELDS),
+        "multiline": ("_multiline", *DISPLAY_FIELDS),
+        "postcode": ("postcode",),
+        "notes": ("notes.added_by",),
+        "multi_occupancy": ("multi_occupancy",),
+        "boundaries": ("postcode",),
+        "coordinates": ("latitude", "longitude"),
+        "classification": ("classification_code",),
+        "street_id": ("usrn",),
+        "branch": ("branch_id",),
+        "last_visit": ("latest_returns.added_by",),
+        "survey_returns": ("latest_returns.added_by",),
+    }
 
     def __init__(self, uprn):
         self.uprn = uprn
 
     @property
     def __schema__(self):
-        last_visit = None
-        if len(self.survey_returns) > 0:
-            last_return = self.survey_returns[0]
-            last_visit = {
-                "date": last_return.date.isoformat(),
-                "visited_by": last_return.added_by.name,
-            }
-
-        returns = self.survey_returns[0:3]
+        # Classifications, boundaries and branches come from the reference cache
+        from services.reference import reference
 
         return Schema(
             self,
@@ -117,21 +159,46 @@ class Address(Model):
                 "multiline",
                 "notes",
                 "multi_occupancy",
-                "boundaries",
             ],
             custom_fields={
-                "coordinates": [self.latitude, self.longitude],
-                "classification": f"({self.classification_code}) {self.classification.class_desc}",
-                "street_id": self.usrn,
-                "branch": {"id": self.branch.id, "name": self.branch.formal_name},
-                "last_visit": last_visit,
-                "survey_returns": returns,
+                "coordinates": Deferred(lambda: [self.latitude, self.longitude]),
+                "classification": Deferred(
+                    lambda: f"({self.classification_code}) {reference.classification(self.classification_code)}"
+                ),
+                "boundaries": Deferred(
+                    lambda: reference.postcode_boundaries(self.postcode)
+                ),
+                "street_id": Deferred(lambda: self.usrn),
+                "branch": Deferred(
+                    lambda: {
+                        "id": self.branch_id,
+                        "name": reference.branch_name(self.branch_id),
+                    }
+                    if self.branch_id is not None
+                    else None
+                ),
+                "last_visit": Deferred(self.last_visit),
+                "survey_returns": Deferred(lambda: self.latest_returns),
             },
         )
 
+    def last_visit(self):
+        if len(self.latest_returns) < 1:
+            return None
+
+        last_return = self.latest_returns[0]
+        return {
+            "date": last_return.date.isoformat(),
+            "visited_by": last_return.added_by.name,
+        }
+
     def view_guard(self, contact):
         return True
 
+    @classmethod
+    def view_guard_many(cls, addresses, contact):
+        return [True] * len(addresses)
+
     def coordinates_filter(self, user):
         try:
             trusted_user(user)
@@ -197,6 +264,9 @@ class Address(Model):
         return pao
 
     def __str__(self):
+        return self.single_line
+
+    def format_single_line(self):
         single_line = ""
 
         if self.sao_str != "":
@@ -216,10 +286,12 @@ class Address(Model):
 
     @property
     def single_line(self):
-        return self.__str__()
+        if self._single_line is not None:
+            return self._single_line
 
-    @property
-    def multiline(self):
+        return self.format_single_line()
+
+    def format_multiline(self):
         address = []
 
         if self.sao_str != "":
@@ -243,6 +315,21 @@ class Address(Model):
 
         return address
 
+    @property
+    def multiline(self):
+        if self._multiline is not None:
+            return self._multiline
+
+        return self.format_multiline()
+
+    def refresh_display(self):
+        """
+        Store the address as text again, after the address or its street changed
+        """
+
+        self._single_line = self.format_single_line()
+        self._multiline = self.format_multiline()
+
 
 class Street(Model):
     __tablename__ = "streets"
@@ -270,11 +357,22 @@ class Street(Model):
         Address, back_populates="street", cascade="all, delete-orphan"
     )
 
-    households = column_property(
-        select([func.count(Address.uprn)])
-        .where(Address.classification_code.like("R%"))
-        .where(Address.usrn == usrn)
-        .as_scalar()
+    # Description and locality, trigram indexed for typo tolerant searches
+    search_text = Column(
+        Text,
+        Computed("upper(coalesce(description, '') || ' ' || coalesce(locality, ''))"),
+    )
+
+    # The number of live residential addresses on the street, from its summaries
+    households = Column(Integer, nullable=False, default=0, server_default="0")
+
+    __table_args__ = (
+        Index(
+            "ix_streets_search_text",
+            search_text,
+            postgresql_using="gin",
+            postgresql_ops={"search_text": "gin_trgm_ops"},
+        ),
     )
 
     def __init__(self, usrn):
@@ -286,6 +384,10 @@ class Street(Model):
         except:
             return False
 
+    @classmethod
+    def view_guard_many(cls, streets, user):
+        return [e2b(trusted_user, user)] * len(streets)
+
     def __schema__(self):
 
         return Schema(
@@ -309,6 +411,9 @@ class Street(Model):
                 "state": self.STATES[self.state_code]
                 if self.state_code is not None
                 else None,
+                "address_counts": Deferred(
+                    lambda: {s.prefix: s.addresses for s in self.summaries}
+                ),
             },
         )
 
@@ -316,6 +421,26 @@ class Street(Model):
         return self.description.upper()
 
 
+class StreetSummary(Model):
+    """
+    How many live addresses of each primary classification a street has, kept
+    up to date by AddressImportService.summarise_streets so that listing streets
+    never has to count their addresses
+    """
+
+    __tablename__ = "street_summaries"
+
+    usrn = Column(
+        BigInteger,
+        ForeignKey("streets.usrn", ondelete="CASCADE", onupdate="CASCADE"),
+        primary_key=True,
+    )
+    prefix = Column(String(1), primary_key=True)
+    addresses = Column(Integer, nullable=False, default=0)
+
+    street = relationship(Street, backref=backref("summaries", passive_deletes=True))
+
+
 class Classification(Model):
     __tablename__ = "classifications"
 
@@ -455,8 +580,34 @@ class Postcode(Model):
         if code is None:
             return None
 
-        bdry = db.query(Boundary).get(code)
-        return bdry
+        from services.reference import reference
+
+        return reference.boundary(code)
+
+
+class AddressBoundary(Model):
+    """
+    The boundaries each address is in, from its postcode. Built at import by
+    AddressImportService.map_boundaries so finding the addresses in a boundary,
+    or the boundaries of an address, is an index lookup.
+    """
+
+    __tablename__ = "address_boundaries"
+
+    uprn = Column(
+        BigInteger, ForeignKey("addresses.uprn", ondelete="CASCADE"), primary_key=True
+    )
+    boundary_code = Column(
+        String(9),
+        ForeignKey("boundaries.code", ondelete="CASCADE", onupdate="CASCADE"),
+        primary_key=True,
+    )
+    # The boundary type, e.g. E05 for wards
+    type = Column(String(3), nullable=False)
+
+    __table_args__ = (
+        Index("ix_address_boundaries_boundary_code_uprn", boundary_code, uprn),
+    )
 
 
 class AddressNote(Model):
@@ -495,7 +646,7 @@ class AddressNote(Model):
         return Schema(
             self,
             ["id", "date", "date", "body"],
-            custom_fields={"added_by": self.added_by.name},
+            custom_fields={"added_by": Deferred(lambda: self.added_by.name)},
         )
 
 
@@ -518,7 +669,9 @@ class SurveyReturn(Model):
         OTHER = "U"
 
     id = Column(Integer, primary_key=True)
-    uprn = Column(BigInteger, ForeignKey("addresses.uprn", ondelete="CASCADE"))
+    uprn = Column(
+        BigInteger, ForeignKey("addresses.uprn", ondelete="CASCADE"), index=True
+    )
     date = Column(Date)
     contact_id = Column(Integer, ForeignKey("contacts.id", ondelete="SET NULL"))
     tenure = Column(EnumColumn(TenureTypes, name="survey_tenure_types"), nullable=True)
@@ -555,12 +708,21 @@ class SurveyReturn(Model):
             ["date", "id"],
             custom_fields={
                 "responses": responses,
-                "collected_by": self.added_by.name,
+                "collected_by": Deferred(lambda: self.added_by.name),
                 "answered": "yes" if self.answered else "no",
             },
         )
 
 
+# The three latest survey returns of each address, for address listings
+Address.latest_returns = latest(
+    Address.uprn,
+    SurveyReturn.uprn,
+    (SurveyReturn.date.desc(), SurveyReturn.id.desc()),
+    3,
+)
+
+
 class HmoLicense(Model):
     __tablename__ = "hmo_register"
 
@@ -578,3 +740,31 @@ class HmoLicense(Model):
         "Address",
         backref=backref("hmo_licenses", order_by="desc(HmoLicense.start_date)"),
     )
+
+
+class ImportWatermark(Model):
+    """
+    The last AddressBase release applied to each of the source tables
+    """
+
+    __tablename__ = "import_watermarks"
+
+    name = Column(String(50), primary_key=True)
+    release = Column(Date, nullable=False)
+    rows = Column(Integer, nullable=False, default=0)
+    applied = Column(DateTime, nullable=False)
+
+    def __init__(self, name):
+        self.name = name
+
+
+class ReferenceVersion(Model):
+    """
+    A counter for each table held in the reference cache (see services.reference),
+    bumped whenever the table is written to so that every process reloads it
+    """
+
+    __tablename__ = "reference_versions"
+
+    name = Column(String(50), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
@@ -1,7 +1,7 @@
 from datetime import date, datetime, timedelta
 from enum import Enum
 from typing import Dict
-from model.Schema import Schema
+from model.Schema import Deferred, Schema
 
 from sqlalchemy import BigInteger, Boolean, Column, Date, DateTime
 from sqlalchemy import Enum as EnumColumn
@@ -11,6 +11,7 @@ from sqlalchemy.orm import relationship, backref
 from model import Model
 from services.permissions import (
     RoleTypes,
+    get_principal,
     trusted_user,
     user_has_position,
     user_has_role,
@@ -75,52 +76,95 @@ class Contact(Model):
     )
     avatar = relationship("File", backref="avatar_user", foreign_keys=[avatar_id])
 
+    # What needs loading to output each schema field (see model.Loaders)
+    __loaders__ = {
+        "id": ("id",),
+        "name": ("given_name", "family_name"),
+        "legal_name": ("given_name", "family_name", "other_names"),
+        "membership_number": ("membership_number",),
+        "first_language": ("first_language",),
+        "pronouns": ("pronouns",),
+        "notes": ("notes.added_by",),
+        "email_addresses": ("email_addresses",),
+        "phone_numbers": ("phone_numbers",),
+        "consents": ("consents",),
+        "positions": ("positions",),
+        "membership_status": (
+            "joined_on",
+            "membership_number",
+            "payments_paused",
+            "memberships",
+        ),
+        "addresses": ("lives_at", "addresses.address.street"),
+        "branch": ("lives_at", "membership_number"),
+        "avatar_url": ("avatar",),
+    }
+
+    # Positions which can see the contacts in their own branch, or in any branch
+    # if they are on a union committee
+    BRANCH_OFFICERS = (
+        RoleTypes.CHAIR,
+        RoleTypes.SEC,
+        RoleTypes.REP,
+        RoleTypes.TRES,
+        RoleTypes.ORG,
+    )
+    UNION_OFFICERS = (
+        RoleTypes.CHAIR,
+        RoleTypes.SEC,
+        RoleTypes.REP,
+        RoleTypes.SREP,
+        RoleTypes.TRES,
+        RoleTypes.ORG,
+        RoleTypes.TRUST,
+    )
+
     def view_guard(self, user):
         if user is not None and user.id == self.id:
             return True
 
         try:
-            user_has_position(
-                user,
-                (
-                    RoleTypes.CHAIR,
-                    RoleTypes.SEC,
-                    RoleTypes.REP,
-                    RoleTypes.TRES,
-                    RoleTypes.ORG,
-                ),
-                branch=self.branch,
-            )
+            user_has_position(user, self.BRANCH_OFFICERS, branch=self.branch)
             return True
         except:
             try:
-                user_has_position(
-                    user,
-                    (
-                        RoleTypes.CHAIR,
-                        RoleTypes.SEC,
-                        RoleTypes.REP,
-                        RoleTypes.SREP,
-                        RoleTypes.TRES,
-                        RoleTypes.ORG,
-                        RoleTypes.TRUST,
-                    ),
-                    union=True,
-                )
+                user_has_position(user, self.UNION_OFFICERS, union=True)
             except:
                 return False
 
+    @classmethod
+    def view_guard_many(cls, contacts, user):
+        """
+        view_guard for a list of contacts, checking the user's positions once for
+        the whole list
+        """
+
+        principal = get_principal(user)
+        if principal is None:
+            return [False] * len(contacts)
+
+        if principal.has_position(cls.BRANCH_OFFICERS) or principal.has_position(
+            cls.UNION_OFFICERS, union=True
+        ):
+            return [True] * len(contacts)
+
+        return [c.id == principal.id for c in contacts]
+
     def __schema__(self):
         cf = {
-            "addresses": self.address_list,
+            "addresses": Deferred(lambda: self.address_list),
+            "branch": Deferred(
+                lambda: (
+                    {"id": self.branch.id, "name": self.branch.formal_name}
+                    if self.branch is not None
+                    else None
+                )
+            ),
+            "avatar_url": Deferred(
+                lambda: self.avatar.public_url if self.avatar is not None else None
+            ),
         }
 
-        if self.branch is not None:
-            cf["branch"] = {"id": self.branch.id, "name": self.branch.formal_name}
-
-        if self.avatar is not None:
-            cf["avatar_url"] = self.avatar.public_url
-
         return Schema(
             self,
             [
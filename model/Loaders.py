@@ -0,0 +1,127 @@
+from sqlalchemy import func, inspect, select
+from sqlalchemy.orm import aliased, foreign, joinedload, load_only, relationship
+from sqlalchemy.orm import selectinload
+
+
+def query_options(model, fields: list) -> list:
+    """
+    Build the loader options which fetch exactly what is needed to output the given
+    fields of a model.
+
+    Models declare what each field needs in `__loaders__`, a dict mapping field
+    names to a tuple of column names and relationship paths, e.g.
+
+        __loaders__ = {
+            "name": ("given_name", "family_name"),
+            "last_visit": ("survey_returns.added_by",),
+        }
+
+    Relationships are eager loaded (collections with a SELECT ... IN, others with
+    a join). Unless every field is declared, all columns are still loaded so we
+    never trade one query for one per row.
+    """
+
+    loaders = getattr(model, "__loaders__", None)
+    if loaders is None or len(fields) < 1:
+        return []
+
+    mapper = inspect(model)
+    columns = set()
+    options = {}
+    complete = True
+
+    for field in fields:
+        if field not in loaders:
+            complete = False
+            continue
+
+        for path in loaders[field]:
+            if path in mapper.column_attrs:
+                columns.add(path)
+                continue
+
+            name = path.split(".", 1)[0]
+            for column in mapper.relationships[name].local_columns:
+                columns.add(mapper.get_property_by_column(column).key)
+
+            options[path] = relationship_loader(mapper, path)
+
+    rv = list(options.values())
+    if complete:
+        rv.append(load_only(*[getattr(model, c) for c in columns]))
+
+    return rv
+
+
+def relationship_loader(mapper, path: str):
+    """
+    Eager load a dotted path of relationships, e.g. "survey_returns.added_by"
+    """
+
+    loader = None
+    entity = mapper.class_
+
+    for name in path.split("."):
+        relationship = mapper.relationships[name]
+        attribute = getattr(entity, name)
+        strategy = selectinload if relationship.uselist else joinedload
+
+        # Relationships to an alias of a class (see latest) are followed through
+        # the alias
+        target = relationship.entity
+        if target.is_aliased_class:
+            attribute = attribute.of_type(target.entity)
+
+        if loader is None:
+            loader = strategy(attribute)
+        else:
+            loader = getattr(loader, strategy.__name__)(attribute)
+
+        mapper = relationship.mapper
+        entity = target.entity
+
+    return loader
+
+
+def latest(local, remote, order_by, count: int):
+    """
+    A read only relationship to just the first `count` children of each parent,
+    e.g. the three latest survey returns of each address:
+
+        Address.latest_returns = latest(
+            Address.uprn, SurveyReturn.uprn, SurveyReturn.date.desc(), 3
+        )
+
+    The children are numbered per parent with ROW_NUMBER() OVER (PARTITION BY
+    ...), so eager loading it for a batch of parents is one query which never
+    fetches more than `count` rows for any of them.
+    """
+
+    if not isinstance(order_by, (list, tuple)):
+        order_by = (order_by,)
+
+    # Aliasing the child needs its mapper configured, so the target is only
+    # built when the relationship is configured
+    built = {}
+
+    def build() -> dict:
+        if len(built) < 1:
+            child = remote.class_
+            ranked = select(
+                child,
+                func.row_number()
+                .over(partition_by=remote, order_by=order_by)
+                .label("row_number"),
+            ).subquery()
+            first = select(ranked).where(ranked.c.row_number <= count).subquery()
+            built["first"] = first
+            built["target"] = aliased(child, first)
+
+        return built
+
+    return relationship(
+        lambda: build()["target"],
+        primaryjoin=lambda: local == foreign(getattr(build()["target"], remote.key)),
+        order_by=lambda: build()["first"].c.row_number,
+        viewonly=True,
+    )
@@ -1,6 +1,6 @@
 from datetime import datetime, timedelta
 from enum import Enum
-from model.Schema import Schema
+from model.Schema import Deferred, Schema
 
 # import services.organisation
 from sqlalchemy import Column, Date, ForeignKey, Integer, String
@@ -8,7 +8,7 @@ from sqlalchemy import Enum as EnumColumn
 from sqlalchemy.orm import relationship
 
 from model import Model
-from services.permissions import trusted_user, RoleTypes
+from services.permissions import e2b, trusted_user, RoleTypes
 
 
 class Branch(Model):
@@ -18,16 +18,28 @@ class Branch(Model):
     name = Column(String(255), nullable=False, unique=True)
     abbreviation = Column(String(2), nullable=False, unique=True)
 
+    # What needs loading to output each schema field (see model.Loaders)
+    __loaders__ = {
+        "id": ("id",),
+        "abbreviation": ("abbreviation",),
+        "name": ("name",),
+        "formal_name": ("id", "abbreviation", "name"),
+        "officers": ("officers",),
+        "postcodes": ("areas",),
+        "members": ("contacts",),
+    }
+
     def view_guard(self, user):
         try:
             trusted_user(user)
         except:
             return False
 
+    @classmethod
+    def view_guard_many(cls, branches, user):
+        return [e2b(trusted_user, user)] * len(branches)
+
     def __schema__(self):
-        pcds = []
-        for a in self.areas:
-            pcds.append(a.postcode)
         return Schema(
             self,
             [
@@ -38,7 +50,10 @@ class Branch(Model):
                 "formal_name",
                 "officers",
             ],
-            custom_fields={"postcodes": pcds, "members": len(self.contacts)},
+            custom_fields={
+                "postcodes": Deferred(lambda: [a.postcode for a in self.areas]),
+                "members": Deferred(lambda: len(self.contacts)),
+            },
         )
 
     @property
@@ -85,12 +100,24 @@ class Committee(Model):
     abbreviation = Column(String(2), nullable=False, unique=True)
     access_level = Column(Integer, nullable=False, default=0)
 
+    # What needs loading to output each schema field (see model.Loaders)
+    __loaders__ = {
+        "id": ("id",),
+        "abbreviation": ("abbreviation",),
+        "name": ("name",),
+        "members": ("members",),
+    }
+
     def view_guard(self, user):
         try:
             trusted_user(user)
         except:
             return False
 
+    @classmethod
+    def view_guard_many(cls, committees, user):
+        return [e2b(trusted_user, user)] * len(committees)
+
     def __schema__(self):
         return Schema(self, ["id", "abbreviation", "name", "members"])
 
@@ -1,7 +1,10 @@
 from datetime import datetime, date
+from decimal import Decimal
+from enum import Enum
 import inspect
-import json
 import types
+from uuid import UUID
+from operator import attrgetter
 from model import Model
 
 
@@ -13,6 +16,140 @@ class FieldNotAllowed(Exception):
     pass
 
 
+class Deferred:
+    """
+    Wraps a custom field so that it is only computed if the field is actually
+    going to be output, i.e. it survives the include list and its filter method.
+    """
+
+    def __init__(self, compute) -> None:
+        self.compute = compute
+
+
+class SchemaPlan:
+    """
+    Everything about serialising a model which doesn't depend on the object
+    itself: which attributes are exposed (in output order), how to read them and
+    which `<field>_filter` method applies to each. Plans are compiled once per
+    model class, field list and set of custom fields.
+    """
+
+    # How many include lists to keep the selected entries of
+    SELECTIONS_SIZE = 64
+
+    def __init__(self, cls, fields: tuple, whitelist: bool, custom: tuple) -> None:
+        names = set(custom)
+
+        for key in dir(cls):
+            if (
+                key.startswith("__")
+                or key.startswith("_")
+                or key.endswith("_guard")
+                or key.endswith("_filter")
+            ):
+                continue
+
+            if len(fields) > 0:
+                if not whitelist and key in fields:
+                    continue
+
+                if whitelist and key not in fields:
+                    continue
+
+            names.add(key)
+
+        entries = []
+        for name in sorted(names):
+            accessor = None
+            if name not in custom:
+                accessor = attrgetter(name)
+
+            entries.append((name, accessor, getattr(cls, f"{name}_filter", None)))
+
+        self.entries = tuple(entries)
+        self.names = frozenset(names)
+        self.__selections = {}
+
+    def select(self, include: tuple) -> tuple:
+        """
+        Return the entries which survive an include list
+        """
+
+        if len(include) < 1:
+            return self.entries
+
+        # Any order or repeat of the same fields shares an entry
+        key = self.names.intersection(include)
+
+        entries = self.__selections.get(key)
+        if entries is None:
+            entries = tuple(e for e in self.entries if e[0] in key)
+            if len(self.__selections) < self.SELECTIONS_SIZE:
+                self.__selections[key] = entries
+
+        return entries
+
+
+_plans = {}
+
+
+def compile_plan(cls, fields, whitelist: bool, custom) -> SchemaPlan:
+    key = (cls, tuple(fields), whitelist, tuple(sorted(custom)))
+
+    plan = _plans.get(key)
+    if plan is None:
+        plan = SchemaPlan(cls, key[1], whitelist, key[3])
+        _plans[key] = plan
+
+    return plan
+
+
+def _as_is(value):
+    return value
+
+
+# How to output each type of leaf value; the JSON encoder takes care of the rest
+_leaf_encoders = {
+    type(None): _as_is,
+    bool: _as_is,
+    int: _as_is,
+    float: _as_is,
+    str: _as_is,
+    list: _as_is,
+    tuple: _as_is,
+    dict: _as_is,
+    datetime: datetime.isoformat,
+    date: date.isoformat,
+    # Plain enums are output by name, e.g. "Types.HOUSE"
+    Enum: str,
+    Decimal: str,
+    UUID: str,
+}
+
+
+def _leaf_encoder(cls):
+    """
+    Look up how to output a value of a given type, resolving subclasses the first
+    time they are seen. Returns None for models and other objects with a schema.
+    """
+
+    try:
+        return _leaf_encoders[cls]
+    except KeyError:
+        pass
+
+    encode = None
+    if not issubclass(cls, Model) and not hasattr(cls, "__schema__"):
+        encode = str
+        for base in cls.__mro__:
+            if base in _leaf_encoders:
+                encode = _leaf_encoders[base]
+                break
+
+    _leaf_encoders[cls] = encode
+    return encode
+
+
 class Schema:
     def __init__(
         self,
@@ -29,53 +166,30 @@ class Schema:
                         property will be used as a blacklist; all fields in the object will be
                         returned except those listed.
         custom_fields:  a dictionary of custom properties to be added into the schema. These
-                        will overload any 'real' properties of the parent object.
+                        will overload any 'real' properties of the parent object. Wrap a
+                        callable in Deferred to only compute the value when it is needed.
         """
 
         self.__object__ = parent
-        self.__fields__ = []
-        self.__custom__ = None
-        self.__map__ = {}
+        self.__custom__ = {}
 
         if custom_fields is not None:
             self.__custom__ = custom_fields
 
-        for key in dir(self.__object__):
-            if key in self.__fields__:
-                continue
-
-            if (
-                key.startswith("__")
-                or key.startswith("_")
-                or key.endswith("_guard")
-                or key.endswith("_filter")
-            ):
-                continue
-
-            if len(fields) > 0:
-                if not whitelist and key in fields:
-                    continue
-
-                if whitelist and key not in fields:
-                    continue
-
-            self.__fields__.append(key)
-
-        self.setup()
+        self.__plan__ = compile_plan(type(parent), fields, whitelist, self.__custom__)
 
-    def setup(self):
-        for field_name in self.__fields__:
-            if not hasattr(self.__object__, field_name):
-                raise InvalidSchema
-
-            field_value = getattr(self.__object__, field_name)
-            self.__map__[field_name] = field_value
+    @property
+    def field_names(self) -> frozenset:
+        """
+        All the fields this schema can output
+        """
 
-        self.__map__ = {**self.__map__, **self.__custom__}
+        return self.__plan__.names
 
     def __validate_obj(self, object, user):
-        if isinstance(object, datetime) or isinstance(object, date):
-            return object.isoformat()
+        encode = _leaf_encoder(type(object))
+        if encode is not None:
+            return encode(object)
 
         is_a_model = issubclass(type(object), Model)
         if is_a_model:
@@ -88,14 +202,9 @@ class Schema:
 
         if not hasattr(object, "__schema__"):
             try:
-                value = json.dumps(object)
-                return object
+                return str(object)
             except:
-                try:
-                    value = str(object)
-                    return value
-                except:
-                    return False
+                return False
 
         schema = getattr(object, "__schema__")
         if callable(schema):
@@ -111,18 +220,18 @@ class Schema:
 
         output_dict = {}
 
-        for property in self.__map__:
-            if len(include) > 0 and property not in include:
-                continue
+        for property, accessor, filter_method in self.__plan__.select(tuple(include)):
+            if filter_method is not None:
+                if filter_method(self.__object__, user) == False:
+                    continue
 
             property_value = []
-            property_object = self.__map__[property]
-
-            filter_method_name = f"{property}_filter"
-            if hasattr(self.__object__, filter_method_name):
-                filter_method = getattr(self.__object__, filter_method_name)
-                if filter_method(user) == False:
-                    continue
+            if accessor is None:
+                property_object = self.__custom__[property]
+                if isinstance(property_object, Deferred):
+                    property_object = property_object.compute()
+            else:
+                property_object = accessor(self.__object__)
 
             if isinstance(property_object, list):
                 for member in property_object:
@@ -141,6 +250,4 @@ class Schema:
             if property_value:
                 output_dict[property] = property_value
 
-        output_dict = dict(sorted(output_dict.items()))
-
         return output_dict
@@ -0,0 +1,77 @@
+from sqlalchemy import Column, DateTime, ForeignKey, Integer, String
+
+from model import Model
+from model.Address import SurveyReturn
+from model.Schema import Schema
+from services.permissions import e2b, trusted_user
+
+# Survey returns are counted by tenure in a column for each type
+TENURE_COLUMNS = {t: f"tenure_{t.name.lower()}" for t in SurveyReturn.TenureTypes}
+
+
+class AreaStats:
+    """
+    Counts for every live address in an area, rolled up by services.stats. Survey
+    returns are counted as they are made, the rest when the stats are refreshed.
+    """
+
+    households = Column(Integer, nullable=False, default=0)
+    addresses = Column(Integer, nullable=False, default=0)
+    survey_returns = Column(Integer, nullable=False, default=0)
+    surveyed = Column(Integer, nullable=False, default=0)
+    members = Column(Integer, nullable=False, default=0)
+    hmo_licences = Column(Integer, nullable=False, default=0)
+    tenure_private_rent = Column(Integer, nullable=False, default=0)
+    tenure_social_rent = Column(Integer, nullable=False, default=0)
+    tenure_licensee = Column(Integer, nullable=False, default=0)
+    tenure_owner_occupier = Column(Integer, nullable=False, default=0)
+    tenure_hmo = Column(Integer, nullable=False, default=0)
+    tenure_other = Column(Integer, nullable=False, default=0)
+    refreshed = Column(DateTime, nullable=False)
+
+    def view_guard(self, user):
+        try:
+            trusted_user(user)
+        except:
+            return False
+
+    @classmethod
+    def view_guard_many(cls, stats, user):
+        return [e2b(trusted_user, user)] * len(stats)
+
+    def __schema__(self):
+        return Schema(
+            self,
+            [
+                "households",
+                "addresses",
+                "survey_returns",
+                "surveyed",
+                "members",
+                "hmo_licences",
+                "refreshed",
+            ],
+            custom_fields={
+                "tenure": {t.name: getattr(self, c) for t, c in TENURE_COLUMNS.items()},
+            },
+        )
+
+
+class BoundaryStats(AreaStats, Model):
+    __tablename__ = "boundary_stats"
+
+    boundary_code = Column(
+        String(9),
+        ForeignKey("boundaries.code", ondelete="CASCADE", onupdate="CASCADE"),
+        primary_key=True,
+    )
+
+
+class BranchStats(AreaStats, Model):
+    __tablename__ = "branch_stats"
+
+    branch_id = Column(
+        Integer,
+        ForeignKey("branches.id", ondelete="CASCADE", onupdate="CASCADE"),
+        primary_key=True,
+    )
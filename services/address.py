@@ -1,13 +1,229 @@
+import io
+import json
 import os
 import shutil
+import time
 import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime
+from functools import partial
 import click
 
+import numpy as np
 import pandas as pd
+from blake3 import blake3
+from pandas.api.types import union_categoricals
+from pyarrow import feather
 from model import db
-from model.Address import Address, Classification, Street, Postcode, Boundary
+from sqlalchemy import and_, case, column, exists, func, or_, select, text
+from sqlalchemy import table as sql_table
+from sqlalchemy.sql.expression import TableClause
+from sqlalchemy.dialects.postgresql import ARRAY, array, insert
+from sqlalchemy.orm import contains_eager
+from model.Address import (
+    Address,
+    AddressBoundary,
+    Classification,
+    Street,
+    StreetSummary,
+    Postcode,
+    Boundary,
+    ImportWatermark,
+)
 
 from services.files import FileService
+from services.organisation import assign_branches
+from services.reference import reference
+from services.stats import refresh_stats
+
+
+class AddressData:
+    """
+    The parsed data for each table, keyed on the model attribute names
+    """
+
+    TABLES = ("classifications", "postcodes", "boundaries", "streets", "addresses")
+
+    def __init__(self):
+        self.classifications = None
+        self.postcodes = None
+        self.boundaries = None
+        self.streets = None
+        self.addresses = None
+
+    def __len__(self):
+        return sum(
+            len(getattr(self, t).index)
+            for t in self.TABLES
+            if getattr(self, t) is not None
+        )
+
+    def write_feather(self, path: str):
+        """
+        Save each table to a Feather file in a directory, writing to a temporary
+        directory first so a partial snapshot is never read
+        """
+
+        temp_path = f"{path}.tmp"
+        os.makedirs(temp_path)
+
+        for t in self.TABLES:
+            frame = getattr(self, t).reset_index(drop=True)
+            feather.write_feather(frame, os.path.join(temp_path, f"{t}.feather"))
+
+        os.rename(temp_path, path)
+
+    @classmethod
+    def read_feather(cls, path: str):
+        data = cls()
+        for t in cls.TABLES:
+            table = feather.read_table(
+                os.path.join(path, f"{t}.feather"), memory_map=True
+            )
+            setattr(data, t, table.to_pandas())
+
+        return data
+
+
+def merge_addresses(blpu, lpi, classes):
+    """
+    Join the BLPUs, LPIs and classifications of a set of addresses, dropping
+    land and parent shells
+    """
+
+    addresses = pd.merge(blpu, lpi, on="UPRN", sort=False)
+    addresses = pd.merge(addresses, classes, on="UPRN", how="left")
+
+    for cl in ("L", "P"):
+        addresses = addresses[
+            ~addresses["CLASSIFICATION_CODE"].str.startswith(cl, na=False)
+        ]
+
+    return addresses.drop_duplicates("UPRN")
+
+
+def encode_rows(frame, arrays=()) -> str:
+    """
+    Encode a dataframe as CSV for COPY. Columns named in `arrays` hold lists,
+    which are written as array literals.
+    """
+
+    if len(arrays) > 0:
+        frame = frame.copy()
+        for col in arrays:
+            frame[col] = frame[col].map(array_literal, na_action="ignore")
+
+    buffer = io.StringIO()
+    frame.to_csv(buffer, index=False, header=False)
+    return buffer.getvalue()
+
+
+def array_literal(values) -> str:
+    items = []
+    for v in values:
+        if v is None:
+            items.append("NULL")
+        else:
+            items.append('"' + v.replace("\\", "\\\\").replace('"', '\\"') + '"')
+
+    return "{" + ",".join(items) + "}"
+
+
+# Marks a line which isn't part of a multiline address
+OMIT = object()
+
+
+def format_part(text, start, start_suffix, end, end_suffix):
+    """
+    Address.sao_str/pao_str for a whole frame
+    """
+
+    start, end = start.astype("Int64"), end.astype("Int64")
+    text = text.astype(object).fillna("")
+    part = text.where((text == "") | start.isna(), text + ", ")
+
+    return (
+        part
+        + start.astype("string").fillna("").astype(object)
+        + start_suffix.astype(object).fillna("")
+        + ("-" + end.astype("string")).fillna("").astype(object)
+        + end_suffix.astype(object).fillna("")
+    )
+
+
+def format_addresses(addresses, streets):
+    """
+    Address.format_single_line and format_multiline for a whole frame of
+    addresses, with string operations on columns rather than per address.
+    Returns a frame of single_line and multiline on the same index.
+    """
+
+    street = pd.merge(
+        addresses[["usrn"]],
+        streets[["usrn", "description", "locality", "town", "admin_area"]],
+        on="usrn",
+        how="left",
+    ).set_index(addresses.index)
+    description = street["description"].astype(object)
+    locality = street["locality"].astype(object)
+    # None is formatted as "None", as it would be in an f-string
+    town = street["town"].astype(object)
+    admin_area = street["admin_area"].astype(object)
+    postcode = addresses["postcode"].astype(object)
+
+    sao = format_part(
+        addresses["sao_text"],
+        addresses["sao_start_number"],
+        addresses["sao_start_suffix"],
+        addresses["sao_end_number"],
+        addresses["sao_end_suffix"],
+    )
+    pao = format_part(
+        addresses["pao_text"],
+        addresses["pao_start_number"],
+        addresses["pao_start_suffix"],
+        addresses["pao_end_number"],
+        addresses["pao_end_suffix"],
+    )
+    numbered = addresses["pao_start_number"].astype("Int64").notna()
+
+    single_line = sao.where(sao == "", sao + ", ") + pao
+    single_line = single_line.where(numbered, single_line + ",")
+    single_line = single_line + " " + description
+    single_line = single_line.where(
+        locality.isna(), single_line + ", " + locality.fillna("")
+    )
+    single_line = (
+        single_line + ", " + town.fillna("None") + ", " + postcode.fillna("None")
+    )
+
+    upper = description.str.upper()
+    same_area = (town == admin_area) | (town.isna() & admin_area.isna())
+    pao_text = addresses["pao_text"].astype(object)
+    lines = pd.DataFrame(
+        {
+            "sao": sao.where(sao != "", OMIT),
+            "pao": (pao + " " + upper).where(numbered, pao_text),
+            "street": upper.where(~numbered, OMIT),
+            "locality": locality.where(locality.notna(), OMIT),
+            "town": town,
+            "admin_area": admin_area.where(~same_area, OMIT),
+            "postcode": postcode,
+        }
+    )
+    multiline = [
+        [None if pd.isna(v) else v for v in row if v is not OMIT]
+        for row in lines.values.tolist()
+    ]
+
+    # Addresses without a street description can't be formatted
+    formatted = description.notna()
+    return pd.DataFrame(
+        {
+            "single_line": single_line.where(formatted, None),
+            "multiline": pd.Series(multiline, index=addresses.index, dtype=object),
+        }
+    ).where(formatted, None)
 
 
 class AddressImportService:
@@ -16,6 +232,16 @@ class AddressImportService:
     DATA_S3_KEY = "AddressData.zip"
     DATA_SAVE_PATH = "~/AddressData"
 
+    # Parsed data is cached here, keyed on the hash of the zip it came from. Bump
+    # the version when parse_data changes.
+    CACHE_PATH = "~/AddressCache"
+    CACHE_VERSION = 2
+    SOURCE_FILE = "source.json"
+
+    # Change-only updates, one zip per release (named by its date)
+    CHANGES_S3_KEY = "AddressChanges/{release}.zip"
+    CHANGES_SAVE_PATH = "~/AddressChanges/{release}"
+
     STREET = "ID11_Street_Records"
     STREET_DESC = "ID15_StreetDesc_Records"
     BLPU = "ID21_BLPU_Records"
@@ -50,6 +276,78 @@ class AddressImportService:
         ("CLASSIFICATION_CODE", "classification_code", "str"),
     )
 
+    STREET_FIELD_MAP = (
+        ("USRN", "usrn"),
+        ("STATE", "state_code"),
+        ("STREET_SURFACE", "surface_code"),
+        ("STREET_CLASSIFICATION", "classification_code"),
+        ("STREET_DESCRIPTION", "description"),
+        ("LOCALITY", "locality"),
+        ("TOWN_NAME", "town"),
+        ("ADMINISTRATIVE_AREA", "admin_area"),
+    )
+
+    # Rows of each CSV to read at a time
+    CHUNK_SIZE = 250000
+
+    # Rows to encode and COPY at a time
+    COPY_BATCH_SIZE = 50000
+
+    # The columns we need from each CSV, and their types
+    STREET_COLUMNS = {
+        "USRN": "Int64",
+        "STATE": "Int8",
+        "STREET_SURFACE": "Int8",
+        "STREET_CLASSIFICATION": "Int8",
+        "STREET_END_DATE": "str",
+    }
+    STREET_DESC_COLUMNS = {
+        "USRN": "Int64",
+        "STREET_DESCRIPTION": "str",
+        "LOCALITY": "category",
+        "TOWN_NAME": "category",
+        "ADMINISTRATIVE_AREA": "category",
+    }
+    BLPU_COLUMNS = {
+        "UPRN": "Int64",
+        "LOGICAL_STATUS": "Int8",
+        "BLPU_STATE": "Int8",
+        "PARENT_UPRN": "Int64",
+        "LATITUDE": "float64",
+        "LONGITUDE": "float64",
+        "POSTCODE_LOCATOR": "category",
+        "MULTI_OCC_COUNT": "Int32",
+    }
+    LPI_COLUMNS = {
+        "UPRN": "Int64",
+        "LOGICAL_STATUS": "Int8",
+        "SAO_START_NUMBER": "Int32",
+        "SAO_START_SUFFIX": "category",
+        "SAO_END_NUMBER": "Int32",
+        "SAO_END_SUFFIX": "category",
+        "SAO_TEXT": "str",
+        "PAO_START_NUMBER": "Int32",
+        "PAO_START_SUFFIX": "category",
+        "PAO_END_NUMBER": "Int32",
+        "PAO_END_SUFFIX": "category",
+        "PAO_TEXT": "str",
+        "USRN": "Int64",
+        "AREA_NAME": "category",
+        "LEVEL": "category",
+    }
+    CLASS_COLUMNS = {
+        "UPRN": "Int64",
+        "CLASSIFICATION_CODE": "category",
+        "END_DATE": "str",
+        "CLASS_SCHEME": "category",
+    }
+
+    # The tables change-only updates are applied to, in the order they're applied
+    CHANGE_TABLES = (STREET, STREET_DESC, BLPU, LPI, CLASS)
+
+    # Street.STATES
+    STREET_DELETED = 4
+
     CL_FIELDS = (
         "Class_Desc",
         "Primary_Code",
@@ -62,84 +360,372 @@ class AddressImportService:
         "Quaternary_Desc",
     )
 
-    def download_data(self):
-        fs = FileService()
-        temp_zip = fs.get_file_object(self.DATA_S3_BUCKET, self.DATA_S3_KEY)
+    def __init__(self, workers: int = 1):
+        """
+        workers:    the number of processes to merge and encode addresses in
+        """
+
+        self.workers = workers
+
+    def download_data(self, release: date = None):
+        """
+        Download and extract the full data set, or the change-only update for a
+        release
+        """
+
+        key = self.DATA_S3_KEY
         DATA_PATH = os.path.expanduser(self.DATA_SAVE_PATH)
+        if release is not None:
+            key = self.CHANGES_S3_KEY.format(release=release.isoformat())
+            DATA_PATH = os.path.expanduser(
+                self.CHANGES_SAVE_PATH.format(release=release.isoformat())
+            )
+
+        fs = FileService()
+        etag = fs.get_file_etag(self.DATA_S3_BUCKET, key)
+        source = self.source(DATA_PATH)
+        if source is not None and source.get("etag") == etag:
+            click.echo("Already downloaded")
+            return
+
+        temp_zip = fs.get_file_object(self.DATA_S3_BUCKET, key)
+
+        digest = blake3()
+        temp_zip.seek(0)
+        for block in iter(lambda: temp_zip.read(2 ** 20), b""):
+            digest.update(block)
 
         with zipfile.ZipFile(temp_zip) as zfile:
             if os.path.exists(DATA_PATH) and os.path.isdir(DATA_PATH):
                 shutil.rmtree(DATA_PATH)
 
-            os.mkdir(DATA_PATH)
+            os.makedirs(DATA_PATH)
             zfile.extractall(DATA_PATH)
 
         temp_zip.close()
 
-    def import_addresses(self):
+        with open(os.path.join(DATA_PATH, self.SOURCE_FILE), "w") as f:
+            json.dump({"etag": etag, "blake3": digest.hexdigest()}, f)
+
+    def source(self, path: str):
+        """
+        Details of the zip a directory of data was extracted from, if known
+        """
+
+        try:
+            with open(os.path.join(path, self.SOURCE_FILE)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def load_data(self):
+        """
+        Parse the extracted data, or load it from the cache if this zip has been
+        parsed before. The cache is a directory of Feather files per source zip,
+        which are memory mapped when they are read.
+        """
+
+        source = self.source(os.path.expanduser(self.DATA_SAVE_PATH))
+        if source is None:
+            return self.parse_data()
+
+        CACHE_PATH = os.path.expanduser(self.CACHE_PATH)
+        path = os.path.join(CACHE_PATH, f"{source['blake3']}-v{self.CACHE_VERSION}")
+        if os.path.isdir(path):
+            return AddressData.read_feather(path)
+
+        data = self.parse_data()
+
+        # Only keep the latest snapshot
+        if os.path.isdir(CACHE_PATH):
+            shutil.rmtree(CACHE_PATH)
+        data.write_feather(path)
+
+        return data
+
+    def import_addresses(self, bulk: bool = False, release: date = None):
         """
         Import all addresses and their associated information.
+
+        bulk:       if True, load the data with COPY and set-based upserts rather
+                    than one ORM object at a time. Existing rows are updated rather
+                    than skipped.
+        release:    the AddressBase release the data is from. If given, change-only
+                    updates can be applied on top of the import from then on.
+        """
+
+        data = self.timed("Parse", self.load_data)
+
+        if bulk:
+            self.save_bulk(data)
+        else:
+            self.save_orm(data)
+
+        self.timed("Branches", assign_branches)
+        self.timed("Address boundaries", self.map_boundaries)
+        self.timed("Statistics", refresh_stats)
+        self.timed("Street summaries", self.summarise_streets)
+        reference.invalidate("classifications", "boundaries", "postcodes")
+
+        if release is not None:
+            for name in self.CHANGE_TABLES:
+                self.set_watermark(name, release, 0)
+            db.commit()
+
+        click.echo(click.style("Done!", fg="green"))
+
+    def timed(self, label: str, stage, *args):
+        """
+        Run a stage of the import and report how many rows it handled per second.
+        The stage returns either the number of rows or an AddressData.
+        """
+
+        start = time.perf_counter()
+        rv = stage(*args)
+        elapsed = time.perf_counter() - start
+
+        rows = rv
+        if isinstance(rv, AddressData):
+            rows = len(rv)
+
+        rate = rows / elapsed if elapsed > 0 else 0
+        click.echo(
+            f"{label.ljust(35)} {rows} rows in {elapsed:.1f}s ({rate:.0f} rows/s)"
+        )
+
+        return rv
+
+    def read(self, name: str, columns: dict, keep=None):
+        """
+        Read the given columns of a CSV, with the given dtypes, a chunk at a time.
+        `keep` selects the rows to keep from each chunk, so only those are ever
+        held in memory.
         """
 
         DATA_PATH = os.path.expanduser(self.DATA_SAVE_PATH)
+        reader = pd.read_csv(
+            os.path.join(DATA_PATH, f"{name}.csv"),
+            usecols=list(columns.keys()),
+            dtype=columns,
+            chunksize=self.CHUNK_SIZE,
+        )
+        if self.CHUNK_SIZE is None:
+            reader = [reader]
+
+        chunks = []
+        for chunk in reader:
+            if keep is not None:
+                chunk = chunk[keep(chunk)]
+            chunks.append(chunk)
+
+        return self.concat(chunks)
+
+    @staticmethod
+    def concat(chunks: list):
+        """
+        Join chunks of a CSV back together, without losing their categoricals to
+        object columns where the chunks have different categories
+        """
 
-        # Load all the data
-        blpu = pd.read_csv(os.path.join(DATA_PATH, f"{self.BLPU}.csv"))
-        lpi = pd.read_csv(os.path.join(DATA_PATH, f"{self.LPI}.csv"))
-        classes = pd.read_csv(os.path.join(DATA_PATH, f"{self.CLASS}.csv"))
-        class_def = pd.read_csv(os.path.join(DATA_PATH, f"{self.CLASS_DEF}.csv"))
-        streets = pd.read_csv(os.path.join(DATA_PATH, f"{self.STREET}.csv"))
-        street_descr = pd.read_csv(os.path.join(DATA_PATH, f"{self.STREET_DESC}.csv"))
-        postcodes = pd.read_csv(os.path.join(DATA_PATH, f"{self.POSTCODES}.csv"))
-        bdry = pd.read_csv(os.path.join(DATA_PATH, f"{self.BOUNDARIES}.csv"))
+        for col, dtype in chunks[0].dtypes.items():
+            if dtype.name != "category" or len(chunks) < 2:
+                continue
+
+            categories = union_categoricals([c[col] for c in chunks]).categories
+            for c in chunks:
+                c[col] = c[col].cat.set_categories(categories)
+
+        return pd.concat(chunks, ignore_index=True)
+
+    def parse_data(self):
+        """
+        Read the extracted CSVs and turn them into one dataframe per table, with
+        columns named after the model attributes.
+        """
+
+        data = AddressData()
+
+        # Classifications
+        class_def = self.read(
+            self.CLASS_DEF,
+            {
+                "Concatenated": "str",
+                **{f: "str" for f in self.CL_FIELDS},
+                "Tertiary_Code": "Int64",
+            },
+        )
+        class_def = class_def.drop_duplicates("Concatenated")
+        data.classifications = class_def[["Concatenated", *self.CL_FIELDS]].rename(
+            columns={"Concatenated": "code", **{f: f.lower() for f in self.CL_FIELDS}}
+        )
+
+        # Postcodes, with the boundary codes in their own column for each type
+        data.postcodes = self.read_postcodes()
+
+        # Boundaries (ward boundaries etc)
+        bdry = self.read(self.BOUNDARIES, {"code": "str", "name": "str"})
+        data.boundaries = bdry.drop_duplicates("code")
 
         # Remove streets that no longer exist
-        streets = streets[["USRN", "STREET_END_DATE"]]
-        streets = streets[streets["STREET_END_DATE"].isnull()]
+        streets = self.read(
+            self.STREET,
+            self.STREET_COLUMNS,
+            lambda c: c["STREET_END_DATE"].isnull(),
+        )
+        street_descr = self.read(self.STREET_DESC, self.STREET_DESC_COLUMNS)
+        street_descr = street_descr.drop_duplicates("USRN")
+        data.streets = pd.merge(streets, street_descr, on="USRN", sort=False)[
+            [s for s, _ in self.STREET_FIELD_MAP]
+        ].rename(columns=dict(self.STREET_FIELD_MAP))
+
+        # Do the addresses!
+        pcds = pd.Index(data.postcodes["pcds"])
+        blpu = self.read(
+            self.BLPU,
+            self.BLPU_COLUMNS,
+            lambda c: (c["LOGICAL_STATUS"] == 1) & c["POSTCODE_LOCATOR"].isin(pcds),
+        )
+        blpu = blpu.drop(columns="LOGICAL_STATUS")
+
+        uprns = pd.Index(blpu["UPRN"])
+        usrns = pd.Index(streets["USRN"])
+        lpi = self.read(
+            self.LPI,
+            self.LPI_COLUMNS,
+            lambda c: (c["LOGICAL_STATUS"] == 1)
+            & c["UPRN"].isin(uprns)
+            & c["USRN"].isin(usrns),
+        )
+        lpi = lpi.drop(columns=["LOGICAL_STATUS"])
+
+        classes = self.read(
+            self.CLASS,
+            self.CLASS_COLUMNS,
+            lambda c: (c["CLASS_SCHEME"] == "AddressBase Premium Classification Scheme")
+            & c["END_DATE"].isna()
+            & c["UPRN"].isin(uprns),
+        )
+        classes = classes.drop(columns=["END_DATE", "CLASS_SCHEME"])
+
+        if self.workers > 1:
+            # Merge each UPRN range in its own process
+            ranges = self.uprn_ranges(uprns, self.workers * 4)
+            with ProcessPoolExecutor(self.workers) as pool:
+                merged = pool.map(
+                    merge_addresses,
+                    (blpu[blpu["UPRN"].between(lo, hi)] for lo, hi in ranges),
+                    (lpi[lpi["UPRN"].between(lo, hi)] for lo, hi in ranges),
+                    (classes[classes["UPRN"].between(lo, hi)] for lo, hi in ranges),
+                )
+                addresses = self.concat(list(merged))
+        else:
+            addresses = merge_addresses(blpu, lpi, classes)
+
+        del blpu, lpi, classes
+
+        addresses = addresses.sort_values(by=["PARENT_UPRN"], na_position="first")
+
+        addresses = addresses[[a for a, _, _ in self.FIELD_MAP]]
+        addresses = addresses.rename(columns={a: p for a, p, _ in self.FIELD_MAP})
+        data.addresses = addresses.join(format_addresses(addresses, data.streets))
+
+        return data
+
+    @staticmethod
+    def uprn_ranges(uprns, count: int) -> list:
+        """
+        Split UPRNs into (up to) `count` contiguous, inclusive ranges of about the
+        same number of UPRNs
+        """
+
+        uprns = np.sort(uprns.unique().to_numpy(dtype="int64"))
+        return [(p[0], p[-1]) for p in np.array_split(uprns, count) if len(p) > 0]
+
+    def read_postcodes(self):
+        """
+        Read the postcodes in the areas we cover, reducing each chunk of the
+        (very wide) postcode directory to the boundary codes we store
+        """
+
+        DATA_PATH = os.path.expanduser(self.DATA_SAVE_PATH)
+        reader = pd.read_csv(
+            os.path.join(DATA_PATH, f"{self.POSTCODES}.csv"),
+            dtype="str",
+            chunksize=self.CHUNK_SIZE,
+        )
+        if self.CHUNK_SIZE is None:
+            reader = [reader]
+
+        chunks = []
+        for postcodes in reader:
+            postcodes = postcodes[
+                postcodes["pcds"].str.match(r"^[A-Z]{2}[1-9]{1}\s", na=False)
+            ]
+
+            pc = pd.DataFrame({"pcds": postcodes["pcds"]})
+            for tc in Boundary.TYPES.keys():
+                pc[tc.lower()] = None
+
+            for col in postcodes.columns.values.tolist()[3:]:
+                codes = postcodes[col]
+                prefix = codes.str[:3]
+                for tc in Boundary.TYPES.keys():
+                    matches = prefix == tc
+                    pc.loc[matches, tc.lower()] = codes[matches]
+
+            for tc in Boundary.TYPES.keys():
+                pc[tc.lower()] = pc[tc.lower()].astype("category")
+
+            chunks.append(pc)
+
+        return self.concat(chunks).drop_duplicates("pcds")
+
+    def save_orm(self, data):
+        """
+        Add each row which isn't already in the database as an ORM object
+        """
 
         # Save the classifications to the database
         with click.progressbar(
-            label="Classifications (reference)".ljust(35), length=len(class_def.index)
+            label="Classifications (reference)".ljust(35),
+            length=len(data.classifications.index),
         ) as pb:
-            for row in class_def.to_dict(orient="records"):
-                cl = Classification(row["Concatenated"])
-
+            for row in data.classifications.to_dict(orient="records"):
                 pb.update(1)
-                if db.query(Classification).get(row["Concatenated"]) is not None:
+                if db.query(Classification).get(row["code"]) is not None:
                     continue
 
+                cl = Classification(row["code"])
                 for prop in self.CL_FIELDS:
-                    if pd.isnull(row[prop]):
+                    if pd.isnull(row[prop.lower()]):
                         continue
 
-                    setattr(cl, prop.lower(), row[prop])
+                    setattr(cl, prop.lower(), row[prop.lower()])
 
                 db.add(cl)
 
         db.commit()
 
         # Save the postcodes to the database
-        postcodes = postcodes[postcodes["pcds"].str.match(r"^[A-Z]{2}[1-9]{1}\s")]
-        pc_cols = postcodes.columns.values.tolist()
-        pc_cols = pc_cols[3:]
         with click.progressbar(
-            label="Postcodes (reference)".ljust(35), length=len(postcodes.index)
+            label="Postcodes (reference)".ljust(35), length=len(data.postcodes.index)
         ) as pb:
-            for pc in postcodes.to_dict(orient="records"):
+            for pc in data.postcodes.to_dict(orient="records"):
                 pb.update(1)
 
                 if db.query(Postcode).get(pc["pcds"]) is not None:
                     continue
 
                 new_pc = Postcode(pc["pcds"])
-                for col in pc_cols:
-                    new_pc.add_code(str(pc[col]))
+                for tc in Boundary.TYPES.keys():
+                    if not pd.isnull(pc[tc.lower()]):
+                        new_pc.add_code(pc[tc.lower()])
 
                 db.add(new_pc)
         db.commit()
 
         # Save the boundaries (ward boundaries etc) to the database
-        for b in bdry.to_dict(orient="records"):
+        for b in data.boundaries.to_dict(orient="records"):
             if db.query(Boundary).get(b["code"]) is not None:
                 continue
             new_bdry = Boundary(**b)
@@ -147,147 +733,621 @@ class AddressImportService:
 
         db.commit()
 
-        # Do the addresses!
-        blpu = blpu[
-            [
-                "UPRN",
-                "LOGICAL_STATUS",
-                "BLPU_STATE",
-                "PARENT_UPRN",
-                "LATITUDE",
-                "LONGITUDE",
-                "POSTCODE_LOCATOR",
-                "MULTI_OCC_COUNT",
-            ]
-        ]
+        # Import streets
+        with click.progressbar(
+            label="Streets".ljust(35), length=len(data.streets.index)
+        ) as pb:
+            for row in data.streets.to_dict(orient="records"):
+                pb.update(1)
+                if db.query(Street).get(int(row["usrn"])) is not None:
+                    continue
 
-        blpu = blpu[blpu["LOGICAL_STATUS"] == 1]
-        blpu = blpu.drop(columns="LOGICAL_STATUS")
-        blpu = blpu[blpu["POSTCODE_LOCATOR"].isin(postcodes["pcds"])]
-
-        lpi = lpi[
-            [
-                "UPRN",
-                "LOGICAL_STATUS",
-                "SAO_START_NUMBER",
-                "SAO_START_SUFFIX",
-                "SAO_END_NUMBER",
-                "SAO_END_SUFFIX",
-                "SAO_TEXT",
-                "PAO_START_NUMBER",
-                "PAO_START_SUFFIX",
-                "PAO_END_NUMBER",
-                "PAO_END_SUFFIX",
-                "PAO_TEXT",
-                "USRN",
-                "AREA_NAME",
-                "LEVEL",
-            ]
+                new_street = Street(int(row["usrn"]))
+                for _, prop in self.STREET_FIELD_MAP[1:]:
+                    if not pd.isna(row[prop]):
+                        setattr(new_street, prop, row[prop])
+
+                db.add(new_street)
+
+            db.commit()
+
+        # Finish addresses
+        x = 0
+        with click.progressbar(
+            label="Addresses".ljust(35), length=len(data.addresses.index)
+        ) as pb:
+            for addr in data.addresses.to_dict(orient="records"):
+                pb.update(1)
+                x += 1
+
+                addr_object = db.query(Address).get(int(addr["uprn"]))
+                if addr_object is not None:
+                    continue
+
+                addr_object = Address(int(addr["uprn"]))
+
+                for _, prop, dtype in self.FIELD_MAP:
+                    if pd.isnull(addr[prop]):
+                        continue
+
+                    if prop == "parent_uprn":
+                        parent = db.query(Address).get(int(addr[prop]))
+                        if parent is None:
+                            continue
+                        addr_object.parent = parent
+                        continue
+
+                    if dtype == "str":
+                        setattr(addr_object, prop, str(addr[prop]))
+                        continue
+
+                    if dtype == "int":
+                        setattr(addr_object, prop, int(addr[prop]))
+                        continue
+
+                    if dtype == "float":
+                        setattr(addr_object, prop, float(addr[prop]))
+                        continue
+
+                if addr["single_line"] is not None:
+                    addr_object._single_line = addr["single_line"]
+                    addr_object._multiline = list(addr["multiline"])
+
+                db.add(addr_object)
+
+                if x % 1000 == 0:
+                    db.commit()
+
+            db.commit()
+
+    def save_bulk(self, data):
+        """
+        Stage each table with COPY and upsert it in one statement. Tables are
+        loaded in the order their foreign keys need.
+        """
+
+        self.timed(
+            "Classifications (reference)",
+            self.upsert,
+            Classification.__table__,
+            data.classifications,
+        )
+        self.timed(
+            "Postcodes (reference)", self.upsert, Postcode.__table__, data.postcodes
+        )
+        self.timed("Boundaries", self.upsert, Boundary.__table__, data.boundaries)
+        self.timed("Streets", self.upsert, Street.__table__, data.streets)
+        self.timed("Addresses", self.upsert_addresses, data.addresses)
+
+    def stage(self, table, frame) -> TableClause:
+        """
+        COPY a dataframe into a temporary table shaped like `table`, which is
+        dropped when the transaction is committed
+        """
+
+        name = f"stage_{table.name}"
+        columns = frame.columns.values.tolist()
+
+        db.execute(
+            text(
+                f"CREATE TEMPORARY TABLE {name} (LIKE {table.name} INCLUDING DEFAULTS) "
+                + "ON COMMIT DROP"
+            )
+        )
+
+        arrays = [c for c in columns if isinstance(table.c[c].type, ARRAY)]
+
+        # Rows are written in the frame's order, so parents are staged before
+        # their children
+        cursor = db.connection().connection.cursor()
+        for batch in self.encode(frame, arrays):
+            cursor.copy_expert(
+                f"COPY {name} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)",
+                io.StringIO(batch),
+            )
+        cursor.close()
+
+        return sql_table(name, *[column(c.name) for c in table.columns])
+
+    def encode(self, frame, arrays=()):
+        """
+        Yield a dataframe as CSV for COPY, in batches of COPY_BATCH_SIZE rows. With
+        more than one worker the batches are encoded in parallel, but still
+        yielded in order.
+        """
+
+        encode = partial(encode_rows, arrays=tuple(arrays))
+
+        batches = [
+            frame.iloc[i : i + self.COPY_BATCH_SIZE]
+            for i in range(0, len(frame.index), self.COPY_BATCH_SIZE)
         ]
 
-        lpi = lpi[lpi["LOGICAL_STATUS"] == 1]
-        lpi = lpi[lpi["UPRN"].isin(blpu["UPRN"])]
-        lpi = lpi[lpi["USRN"].isin(streets["USRN"])]
-        lpi = lpi.drop(columns=["LOGICAL_STATUS"])
+        if self.workers > 1 and len(batches) > 1:
+            with ProcessPoolExecutor(self.workers) as pool:
+                yield from pool.map(encode, batches)
+        else:
+            yield from map(encode, batches)
+
+    def upsert(self, table, frame, values=None, where=None) -> int:
+        """
+        Insert or update every row of a dataframe in a table. `values` can replace
+        the staged value of a column with an SQL expression, and `where` can
+        filter the staged rows; both are given the staging table.
+        """
+
+        if len(frame.index) < 1:
+            return 0
+
+        columns = frame.columns.values.tolist()
+        staged = self.stage(table, frame)
+        key = [c.name for c in table.primary_key.columns]
+
+        selected = []
+        for c in columns:
+            if values is not None and c in values:
+                selected.append(values[c](staged))
+            else:
+                selected.append(staged.c[c])
+
+        rows = select(*selected)
+        if where is not None:
+            rows = rows.where(where(staged))
+
+        stmt = insert(table).from_select(columns, rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=key,
+            set_={c: stmt.excluded[c] for c in columns if c not in key},
+        )
+
+        db.execute(stmt)
+        db.commit()
+
+        return len(frame.index)
+
+    def upsert_addresses(self, addresses, where=None) -> int:
+        """
+        Upsert addresses, only linking a parent which is being imported or is
+        already in the database. A staged parent only counts if `where` lets it
+        through too.
+        """
+
+        table = Address.__table__
+
+        def parent_uprn(staged):
+            parent = staged.alias("parent")
+            imported = exists().where(parent.c.uprn == staged.c.parent_uprn)
+            if where is not None:
+                imported = imported.where(where(parent))
+
+            return case(
+                (
+                    or_(
+                        imported,
+                        exists().where(table.c.uprn == staged.c.parent_uprn),
+                    ),
+                    staged.c.parent_uprn,
+                ),
+                else_=None,
+            )
+
+        return self.upsert(table, addresses, {"parent_uprn": parent_uprn}, where)
+
+    def update(self, table, frame, values=None, where=None) -> int:
+        """
+        Update the rows of a table which match the keys of a dataframe, setting
+        its other columns and any constant `values`. `where` can filter the staged
+        rows.
+        """
+
+        if len(frame.index) < 1:
+            return 0
 
-        addresses = pd.merge(blpu, lpi, on="UPRN", sort=False)
-        classes = classes[["UPRN", "CLASSIFICATION_CODE", "END_DATE", "CLASS_SCHEME"]]
-        classes = classes[
-            classes["CLASS_SCHEME"] == "AddressBase Premium Classification Scheme"
+        staged = self.stage(table, frame)
+        key = [c.name for c in table.primary_key.columns]
+
+        stmt = table.update()
+        for k in key:
+            stmt = stmt.where(table.c[k] == staged.c[k])
+
+        if where is not None:
+            stmt = stmt.where(where(staged))
+
+        columns = {c: staged.c[c] for c in frame.columns if c not in key}
+        if values is not None:
+            columns.update(values)
+
+        db.execute(stmt.values(columns))
+        db.commit()
+
+        return len(frame.index)
+
+    def import_changes(self, release: date):
+        """
+        Apply an AddressBase change-only update. Each source table keeps a
+        watermark of the last release applied to it, so a table is only ever
+        updated in release order and a partly applied release can be re-run.
+        """
+
+        DATA_PATH = os.path.expanduser(
+            self.CHANGES_SAVE_PATH.format(release=release.isoformat())
+        )
+        watermarks = {w.name: w.release for w in db.query(ImportWatermark).all()}
+
+        # Only the areas the changed addresses were in before this release, or
+        # are in after it, need their counts recomputing
+        uprns = self.changed_uprns(DATA_PATH)
+        before = self.areas_of(uprns)
+
+        appliers = {
+            self.STREET: self.apply_street_changes,
+            self.STREET_DESC: self.apply_street_descr_changes,
+            self.BLPU: self.apply_blpu_changes,
+            self.LPI: self.apply_lpi_changes,
+            self.CLASS: self.apply_class_changes,
+        }
+
+        for name in self.CHANGE_TABLES:
+            applied = watermarks.get(name)
+            if applied is not None and applied >= release:
+                click.echo(f"{name.ljust(35)} already at {applied.isoformat()}")
+                continue
+
+            path = os.path.join(DATA_PATH, f"{name}.csv")
+            rows = 0
+            if os.path.exists(path):
+                rows = self.timed(name, appliers[name], pd.read_csv(path), release)
+
+            self.set_watermark(name, release, rows)
+            db.commit()
+
+        postcodes = [
+            pc
+            for pc, in db.query(Address.postcode)
+            .filter(Address.uprn.in_(uprns), Address.postcode != None)
+            .distinct()
         ]
-        classes = classes[classes["END_DATE"].isna()]
-        classes = classes.drop(columns=["END_DATE", "CLASS_SCHEME"])
-        addresses = pd.merge(addresses, classes, on="UPRN", how="left")
 
-        for cl in ("L", "P"):
-            addresses = addresses[~addresses["CLASSIFICATION_CODE"].str.startswith(cl)]
+        self.timed("Address text", self.refresh_display)
+        self.timed("Branches", partial(assign_branches, postcodes=postcodes))
+        self.timed("Address boundaries", self.map_boundaries, uprns)
 
-        addresses = addresses.sort_values(by=["PARENT_UPRN"], na_position="first")
+        usrns, boundaries, branches = [
+            list(b | a) for b, a in zip(before, self.areas_of(uprns))
+        ]
+        self.timed("Statistics", refresh_stats, boundaries, branches)
+        self.timed("Street summaries", self.summarise_streets, usrns)
 
-        # Import streets
-        streets = pd.read_csv(os.path.join(DATA_PATH, f"{self.STREET}.csv"))
-        streets = pd.merge(streets, street_descr, on="USRN", sort=False)
+        click.echo(click.style("Done!", fg="green"))
 
-        with click.progressbar(
-            label="Streets".ljust(35), length=len(streets.index)
-        ) as pb:
-            for row in streets.to_dict(orient="records"):
-                pb.update(1)
-                if db.query(Street).get(int(row["USRN"])) is not None:
-                    continue
+    def changed_uprns(self, path: str) -> list:
+        """
+        The addresses in a change-only update, from every change file which has
+        them. This includes files applied by an earlier run which didn't finish.
+        """
 
-                new_street = Street(row["USRN"])
-                if not pd.isna(row["STREET_END_DATE"]):
-                    continue
+        uprns = set()
+        for name in (self.BLPU, self.LPI, self.CLASS):
+            file = os.path.join(path, f"{name}.csv")
+            if os.path.exists(file):
+                uprns.update(pd.read_csv(file, usecols=["UPRN"])["UPRN"].tolist())
+
+        return list(uprns)
 
-                if not pd.isna(row["STATE"]):
-                    new_street.state_code = row["STATE"]
+    def areas_of(self, uprns: list) -> tuple:
+        """
+        The streets, boundaries and branches some addresses are in, as sets
+        """
 
-                if not pd.isna(row["STREET_SURFACE"]):
-                    new_street.surface_code = row["STREET_SURFACE"]
+        if len(uprns) < 1:
+            return set(), set(), set()
 
-                if not pd.isna(row["STREET_CLASSIFICATION"]):
-                    new_street.classification_code = row["STREET_CLASSIFICATION"]
+        streets, branches = set(), set()
+        for usrn, branch_id in db.query(Address.usrn, Address.branch_id).filter(
+            Address.uprn.in_(uprns)
+        ):
+            streets.add(usrn)
+            branches.add(branch_id)
 
-                if not pd.isna(row["STREET_DESCRIPTION"]):
-                    new_street.description = row["STREET_DESCRIPTION"]
+        boundaries = {
+            code
+            for code, in db.query(AddressBoundary.boundary_code)
+            .filter(AddressBoundary.uprn.in_(uprns))
+            .distinct()
+        }
 
-                if not pd.isna(row["LOCALITY"]):
-                    new_street.locality = row["LOCALITY"]
+        return streets - {None}, boundaries, branches - {None}
 
-                if not pd.isna(row["TOWN_NAME"]):
-                    new_street.town = row["TOWN_NAME"]
+    def refresh_display(self) -> int:
+        """
+        Store the text of every address which doesn't have it, i.e. new addresses
+        and those which have changed (or whose street has)
+        """
 
-                if not pd.isna(row["ADMINISTRATIVE_AREA"]):
-                    new_street.admin_area = row["ADMINISTRATIVE_AREA"]
+        rows = 0
+        while True:
+            addresses = (
+                db.query(Address)
+                .join(Address.street)
+                .options(contains_eager(Address.street))
+                .filter(Address._single_line == None, Street.description != None)
+                .limit(self.COPY_BATCH_SIZE)
+                .all()
+            )
+            if len(addresses) < 1:
+                break
 
-                db.add(new_street)
+            for a in addresses:
+                a.refresh_display()
 
             db.commit()
+            rows += len(addresses)
 
-            # Finish addresses
-            x = 0
-            with click.progressbar(
-                label="Addresses".ljust(35), length=len(addresses.index)
-            ) as pb:
-                for addr in addresses.to_dict(orient="records"):
-                    pb.update(1)
-                    x += 1
-
-                    addr_object = db.query(Address).get(int(addr["UPRN"]))
-                    if addr_object is not None:
-                        continue
+        return rows
 
-                    addr_object = Address(int(addr["UPRN"]))
+    def map_boundaries(self, uprns: list = None) -> int:
+        """
+        Store the boundaries of each address from its postcode, adding the
+        mappings which are missing and removing those which no longer apply
 
-                    for attribute, prop, dtype in self.FIELD_MAP:
-                        if pd.isnull(addr[attribute]):
-                            continue
+        uprns:  if given, only map these addresses again (e.g. those in a
+                change-only update)
+        """
 
-                        if attribute == "PARENT_UPRN":
-                            parent = db.query(Address).get(addr[attribute])
-                            if parent is None:
-                                continue
-                            addr_object.parent = parent
-                            continue
+        if uprns is not None and len(uprns) < 1:
+            return 0
 
-                        if dtype == "str":
-                            setattr(addr_object, prop, str(addr[attribute]))
-                            continue
+        mappings = AddressBoundary.__table__
+        codes = select(
+            Address.uprn,
+            func.unnest(
+                array([getattr(Postcode, c.lower()) for c in Boundary.TYPES])
+            ).label("code"),
+        ).join(Postcode, Postcode.pcds == Address.postcode)
+        stale = mappings.delete()
+        if uprns is not None:
+            codes = codes.where(Address.uprn.in_(uprns))
+            stale = stale.where(mappings.c.uprn.in_(uprns))
 
-                        if dtype == "int":
-                            setattr(addr_object, prop, int(addr[attribute]))
-                            continue
+        codes = codes.subquery()
+        current = select(codes.c.uprn, codes.c.code, func.left(codes.c.code, 3)).join(
+            Boundary, Boundary.code == codes.c.code
+        )
 
-                        if dtype == "float":
-                            setattr(addr_object, prop, float(addr[attribute]))
-                            continue
+        stmt = insert(mappings).from_select(["uprn", "boundary_code", "type"], current)
+        rows = db.execute(stmt.on_conflict_do_nothing()).rowcount
+
+        rows += db.execute(
+            stale.where(
+                ~exists()
+                .where(Address.uprn == mappings.c.uprn)
+                .where(Postcode.pcds == Address.postcode)
+                .where(
+                    mappings.c.boundary_code.in_(
+                        [getattr(Postcode, c.lower()) for c in Boundary.TYPES]
+                    )
+                )
+            )
+        ).rowcount
+        db.commit()
+
+        return rows
+
+    def summarise_streets(self, usrns: list = None) -> int:
+        """
+        Store the number of live addresses on each street for each primary
+        classification (e.g. R for residential), and the street's households from
+        them. Only the counts which have changed are written.
+
+        usrns:  if given, only summarise these streets
+        """
+
+        if usrns is not None and len(usrns) < 1:
+            return 0
+
+        summaries = StreetSummary.__table__
+        streets = Street.__table__
+        prefix = func.left(Address.classification_code, 1)
+        counts = (
+            select(
+                Address.usrn,
+                prefix.label("prefix"),
+                func.count(Address.uprn).label("addresses"),
+            )
+            .where(Address.usrn != None, Address.classification_code != None)
+            .where(Address.retired_on == None)
+            .group_by(Address.usrn, prefix)
+        )
+        stale = summaries.delete()
+        if usrns is not None:
+            counts = counts.where(Address.usrn.in_(usrns))
+            stale = stale.where(summaries.c.usrn.in_(usrns))
+
+        stmt = insert(summaries).from_select(["usrn", "prefix", "addresses"], counts)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["usrn", "prefix"],
+            set_={"addresses": stmt.excluded.addresses},
+            where=summaries.c.addresses != stmt.excluded.addresses,
+        )
+        rows = db.execute(stmt).rowcount
+
+        # Counts for streets with none of a classification left
+        rows += db.execute(
+            stale.where(
+                ~exists()
+                .where(Address.usrn == summaries.c.usrn)
+                .where(prefix == summaries.c.prefix)
+                .where(Address.retired_on == None)
+            )
+        ).rowcount
+
+        households = func.coalesce(summaries.c.addresses, 0)
+        current = (
+            select(streets.c.usrn, households.label("households"))
+            .select_from(
+                streets.outerjoin(
+                    summaries,
+                    and_(summaries.c.usrn == streets.c.usrn, summaries.c.prefix == "R"),
+                )
+            )
+            .where(streets.c.households != households)
+        )
+        if usrns is not None:
+            current = current.where(streets.c.usrn.in_(usrns))
+
+        current = current.subquery()
+        db.execute(
+            streets.update()
+            .where(streets.c.usrn == current.c.usrn)
+            .values(households=current.c.households)
+        )
+        db.commit()
+
+        return rows
+
+    def set_watermark(self, name: str, release: date, rows: int):
+        watermark = db.query(ImportWatermark).get(name)
+        if watermark is None:
+            watermark = ImportWatermark(name)
+            db.add(watermark)
+
+        watermark.release = release
+        watermark.rows = rows
+        watermark.applied = datetime.now()
 
-                    db.add(addr_object)
+    @staticmethod
+    def changed(changes, key: str, live):
+        """
+        Split change records into the latest live version of each record, and
+        the keys of the records which have been deleted or retired
+        """
+
+        live = live & changes["CHANGE_TYPE"].isin(("I", "U"))
+        current = changes[live].drop_duplicates(key, keep="last")
+        retired = changes[~live & ~changes[key].isin(current[key])]
+
+        return current, retired[[key]].drop_duplicates()
+
+    def apply_street_changes(self, changes, release: date) -> int:
+        """
+        Streets: upsert live streets, and mark ended or deleted ones as such
+        """
+
+        current, ended = self.changed(
+            changes, "USRN", changes["STREET_END_DATE"].isnull()
+        )
+
+        fields = self.STREET_FIELD_MAP[:4]
+        current = current[[s for s, _ in fields]].rename(columns=dict(fields))
+        for _, prop in fields:
+            current[prop] = current[prop].astype("Int64")
+
+        ended = ended.rename(columns={"USRN": "usrn"})
+
+        return self.upsert(Street.__table__, current) + self.update(
+            Street.__table__, ended, {"state_code": self.STREET_DELETED}
+        )
+
+    def apply_street_descr_changes(self, changes, release: date) -> int:
+        """
+        Street descriptions, for streets which have already been imported
+        """
+
+        current = changes[changes["CHANGE_TYPE"].isin(("I", "U"))]
+        current = current.drop_duplicates("USRN")
+
+        fields = (self.STREET_FIELD_MAP[0], *self.STREET_FIELD_MAP[4:])
+        current = current[[s for s, _ in fields]].rename(columns=dict(fields))
+        current["usrn"] = current["usrn"].astype("Int64")
+
+        updated = self.update(Street.__table__, current)
+
+        # The text of the addresses on these streets needs refreshing
+        db.execute(
+            Address.__table__.update()
+            .where(Address.usrn.in_(current["usrn"].dropna().tolist()))
+            .values(single_line=None, multiline=None)
+        )
+        db.commit()
+
+        return updated
+
+    def apply_blpu_changes(self, changes, release: date) -> int:
+        """
+        BLPUs: upsert live addresses (reinstating any which were retired) in the
+        postcodes we cover, and retire the rest
+        """
+
+        current, retired = self.changed(changes, "UPRN", changes["LOGICAL_STATUS"] == 1)
+
+        fields = [f for f in self.FIELD_MAP if f[0] in changes.columns]
+        current = current[[a for a, _, _ in fields]].rename(
+            columns={a: p for a, p, _ in fields}
+        )
+        for _, prop, dtype in fields:
+            if dtype == "int":
+                current[prop] = current[prop].astype("Int64")
+        current["retired_on"] = None
+        current["single_line"] = None
+        current["multiline"] = None
+
+        retired = retired.rename(columns={"UPRN": "uprn"})
+
+        def covered(staged):
+            return exists().where(Postcode.pcds == staged.c.postcode)
+
+        return self.upsert_addresses(current, covered) + self.update(
+            Address.__table__, retired, {"retired_on": release}
+        )
+
+    def apply_lpi_changes(self, changes, release: date) -> int:
+        """
+        LPIs: update the address fields of imported addresses. Historic LPIs are
+        replaced by a new one, so only live ones are applied.
+        """
+
+        live = changes["LOGICAL_STATUS"] == 1
+        current = changes[live & changes["CHANGE_TYPE"].isin(("I", "U"))]
+        current = current.drop_duplicates("UPRN", keep="last")
+
+        fields = [f for f in self.FIELD_MAP if f[0] in changes.columns]
+        current = current[[a for a, _, _ in fields]].rename(
+            columns={a: p for a, p, _ in fields}
+        )
+        for _, prop, dtype in fields:
+            if dtype == "int":
+                current[prop] = current[prop].astype("Int64")
+        current["single_line"] = None
+        current["multiline"] = None
+
+        def on_known_street(staged):
+            return exists().where(Street.usrn == staged.c.usrn)
+
+        return self.update(Address.__table__, current, where=on_known_street)
+
+    def apply_class_changes(self, changes, release: date) -> int:
+        """
+        Classifications: reclassify addresses, retiring any which are no longer
+        addressable (land and parent shells)
+        """
+
+        current = changes[
+            changes["CHANGE_TYPE"].isin(("I", "U"))
+            & changes["END_DATE"].isna()
+            & (changes["CLASS_SCHEME"] == "AddressBase Premium Classification Scheme")
+        ]
+        current = current.drop_duplicates("UPRN", keep="last")
+        current = current[["UPRN", "CLASSIFICATION_CODE"]].rename(
+            columns={"UPRN": "uprn", "CLASSIFICATION_CODE": "classification_code"}
+        )
 
-                    if x % 1000 == 0:
-                        db.commit()
+        excluded = current["classification_code"].str.match(r"^[LP]", na=False)
 
-                db.commit()
+        def known(staged):
+            return exists().where(Classification.code == staged.c.classification_code)
 
-            click.echo(click.style("Done!", fg="green"))
+        return self.update(
+            Address.__table__, current[~excluded], where=known
+        ) + self.update(
+            Address.__table__, current[excluded][["uprn"]], {"retired_on": release}
+        )
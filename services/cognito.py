@@ -1,13 +1,17 @@
 import os
+import time
 from base64 import b64decode
+from pathlib import Path
 
 import boto3
 import jwt
 from jwt import PyJWKClient
+from jwt.exceptions import PyJWKClientError
 import settings
 from falcon import HTTPForbidden
 from model import db
 from model.Contact import Contact, EmailAddress, UserIdentity
+from services.refresher import BackgroundRefresher
 
 REGION = settings.config["cognito"].get("region")
 USER_POOL_ID = settings.config["cognito"].get("user_pool_id")
@@ -16,6 +20,11 @@ CERT_URL = (
 )
 ISS_CLAIM = f"https://cognito-idp.{REGION}.amazonaws.com/{USER_POOL_ID}"
 
+# A local JWKS file or URL can be used in place of the Cognito endpoint
+# (e.g. for tests and benchmarks)
+JWKS_URL = settings.config["cognito"].get("jwks_url") or CERT_URL
+JWKS_TTL = int(settings.config["cognito"].get("jwks_ttl") or 3600)
+
 cognito = boto3.client(
     "cognito-idp",
     aws_access_key_id=settings.config["aws"].get("access_key"),
@@ -24,13 +33,87 @@ cognito = boto3.client(
 )
 
 
-def validate_token(jwt_string: str) -> Contact:
+class KeyStore(BackgroundRefresher):
     """
-    Takes an authentication token, validates it, and returns the relevant contact
+    Process-wide store of the signing keys published by the user pool.
+
+    Keys are loaded once at startup and refreshed in the background every `ttl`
+    seconds, so verifying a token never has to wait on the network. A token
+    signed with a key we have not seen triggers a single refetch; concurrent
+    requests for unknown keys wait on that one fetch rather than each making
+    their own.
     """
 
-    key_client = PyJWKClient(CERT_URL, cache_keys=True)
-    public_key = key_client.get_signing_key_from_jwt(jwt_string)
+    DESCRIPTION = "signing keys"
+
+    # Don't refetch for unknown keys more often than this (seconds)
+    MISS_INTERVAL = 30
+
+    def __init__(self, url: str, ttl: int = 3600):
+        if os.path.exists(url):
+            url = Path(url).resolve().as_uri()
+
+        super().__init__(ttl)
+
+        self.url = url
+        self.keys = {}
+        self.fetched_at = 0.0
+
+    def refresh(self):
+        """
+        Fetch the key set and atomically replace the cached keys
+        """
+
+        client = PyJWKClient(self.url, cache_keys=False)
+        keys = {k.key_id: k for k in client.get_signing_keys()}
+
+        self.keys = keys
+        self.fetched_at = time.monotonic()
+
+    def get(self, kid: str):
+        """
+        Return the signing key for a key ID, refetching once if it is unknown
+        """
+
+        key = self.keys.get(kid)
+        if key is not None:
+            return key
+
+        fetched_at = self.fetched_at
+        with self._lock:
+            # Another thread may have refreshed while we waited for the lock
+            if self.fetched_at == fetched_at:
+                if time.monotonic() - self.fetched_at > self.MISS_INTERVAL:
+                    self.refresh()
+
+        key = self.keys.get(kid)
+        if key is None:
+            raise PyJWKClientError(
+                f'Unable to find a signing key that matches: "{kid}"'
+            )
+
+        return key
+
+
+key_store = KeyStore(JWKS_URL, JWKS_TTL)
+
+
+def start_key_store():
+    """
+    Load the signing keys and keep them refreshed in the background
+    """
+
+    print("Loading signing keys...\n")
+    key_store.start()
+
+
+def decode_token(jwt_string: str) -> dict:
+    """
+    Verify an access token and return its claims
+    """
+
+    header = jwt.get_unverified_header(jwt_string)
+    public_key = key_store.get(header.get("kid"))
 
     token = jwt.decode(
         jwt_string, public_key.key, algorithms=["RS256"], issuer=ISS_CLAIM
@@ -38,6 +121,15 @@ def validate_token(jwt_string: str) -> Contact:
     if token["token_use"] != "access":
         raise HTTPForbidden(description="Invalid authentication token")
 
+    return token
+
+
+def get_token_contact(token: dict) -> Contact:
+    """
+    Return the contact linked to the identity in a verified token, linking one
+    if this is the first time we have seen the identity
+    """
+
     identity: UserIdentity = db.get(UserIdentity, token["sub"])
     if identity is not None:
         return identity.contact
@@ -0,0 +1,29 @@
+from decimal import Decimal
+
+import orjson
+
+# Dates, datetimes, enums (by value), UUIDs and floats are encoded natively;
+# dict keys don't have to be strings
+OPTIONS = orjson.OPT_NON_STR_KEYS
+
+
+def default(obj):
+    """
+    Encode the types orjson doesn't know about
+    """
+
+    if isinstance(obj, Decimal):
+        return str(obj)
+
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+
+    raise TypeError
+
+
+def dumps(obj) -> bytes:
+    return orjson.dumps(obj, default=default, option=OPTIONS)
+
+
+def loads(data):
+    return orjson.loads(data)
@@ -53,6 +53,19 @@ class FileService:
         obj_info = s3.head_object(Bucket=file.bucket, Key=file.key)
         return obj_info["ContentLength"]
 
+    def get_file_etag(self, bucket, key):
+        """
+        Returns the ETag of a file, which changes whenever its content does
+        """
+
+        try:
+            obj_info = s3.head_object(Bucket=bucket, Key=key)
+        except:
+            raise falcon.HTTPInternalServerError(
+                description="There was an error attempting to retrieve the file."
+            )
+        return obj_info["ETag"]
+
     def store_file_secure(self, file_obj, file_id):
         """
         Stores a file in a secure bucket which can only be accessed by authorised users
@@ -1,4 +1,7 @@
-from sqlalchemy import func
+import threading
+import time
+from collections import defaultdict
+from sqlalchemy import func, or_, select, update
 from model import db
 from datetime import date, timedelta
 
@@ -49,3 +52,178 @@ def get_membership_status(contact):
     #     return "ARREARS"
 
     return "ACTIVE"
+
+
+class BranchAreas:
+    """
+    Process-wide longest-prefix trie of branch area postcodes, so finding the
+    branch which covers a postcode never needs the database.
+
+    The trie is built on first use, and rebuilt (then swapped in whole, so
+    readers never see half of one) whenever this process changes branch areas
+    or the trie is older than `ttl` seconds, to pick up changes made elsewhere.
+    """
+
+    def __init__(self, ttl: int = 60):
+        self.ttl = ttl
+        self.root = None
+        self.built_at = 0.0
+
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        """
+        Build a new trie from the branch areas and replace the current one
+        """
+        from model.Organisation import BranchArea
+
+        # Each node is [branch_id, {character: child node}]
+        root = [None, {}]
+        areas = db.query(BranchArea.postcode, BranchArea.branch_id).order_by(
+            BranchArea.id
+        )
+        for prefix, branch_id in areas:
+            node = root
+            for char in prefix.upper():
+                node = node[1].setdefault(char, [None, {}])
+            node[0] = branch_id
+
+        self.root = root
+        self.built_at = time.monotonic()
+
+    def trie(self) -> list:
+        built_at = self.built_at
+        if self.root is None or time.monotonic() - built_at > self.ttl:
+            with self._lock:
+                # Another thread may have rebuilt while we waited for the lock
+                if self.built_at == built_at:
+                    self.refresh()
+
+        return self.root
+
+    def resolve(self, postcode: str):
+        """
+        The ID of the branch whose area is the longest prefix of a postcode, or
+        None if no branch covers it
+        """
+
+        return self._resolve(self.trie(), postcode)
+
+    def resolve_many(self, postcodes) -> dict:
+        """
+        Resolve many postcodes at once, as {postcode: branch ID or None}
+        """
+
+        root = self.trie()
+        return {pc: self._resolve(root, pc) for pc in postcodes}
+
+    @staticmethod
+    def _resolve(node: list, postcode: str):
+        if postcode is None:
+            return None
+
+        branch_id = node[0]
+        for char in postcode.upper():
+            node = node[1].get(char)
+            if node is None:
+                break
+            if node[0] is not None:
+                branch_id = node[0]
+
+        return branch_id
+
+
+branch_areas = BranchAreas()
+
+# How many postcodes to move to a branch in one UPDATE
+ASSIGN_BATCH_SIZE = 10000
+
+
+def assign_branches(prefixes=None, postcodes=None) -> int:
+    """
+    Store the branch of each address: the branch with the longest area postcode
+    prefix matching its postcode, or none. Only addresses whose branch has
+    changed are written.
+
+    Recomputing every address is done a postcode at a time in one statement.
+    Recomputing some postcodes resolves them against the branch area trie, then
+    updates the addresses for each branch together.
+
+    prefixes:   if given, only recompute the postcodes starting with one of these
+                (e.g. the old and new areas of a branch which has changed)
+    postcodes:  if given, only recompute these postcodes (e.g. those of the
+                addresses in a change-only update)
+    """
+    from model.Address import Address, Postcode
+
+    if prefixes is not None and "" in prefixes:
+        prefixes = None
+
+    if prefixes is None and postcodes is None:
+        return assign_all_branches()
+
+    # Branch areas may have just changed
+    branch_areas.refresh()
+
+    selected = db.query(Postcode.pcds)
+    if prefixes is not None:
+        if len(prefixes) < 1:
+            return 0
+        selected = selected.filter(
+            or_(*[Postcode.pcds.startswith(p, autoescape=True) for p in prefixes])
+        )
+    if postcodes is not None:
+        if len(postcodes) < 1:
+            return 0
+        selected = selected.filter(Postcode.pcds.in_(postcodes))
+
+    branches = defaultdict(list)
+    for pc, branch_id in branch_areas.resolve_many(pc for pc, in selected).items():
+        branches[branch_id].append(pc)
+
+    rows = 0
+    for branch_id, pcs in branches.items():
+        for i in range(0, len(pcs), ASSIGN_BATCH_SIZE):
+            rows += db.execute(
+                update(Address)
+                .where(Address.postcode.in_(pcs[i : i + ASSIGN_BATCH_SIZE]))
+                .where(Address.branch_id.is_distinct_from(branch_id))
+                .values(branch_id=branch_id)
+                .execution_options(synchronize_session=False)
+            ).rowcount
+    db.commit()
+
+    return rows
+
+
+def assign_all_branches() -> int:
+    """
+    Store the branch of every address, matching postcodes to branch areas in SQL
+    """
+    from model.Address import Address, Postcode
+    from model.Organisation import BranchArea
+
+    postcodes = select(Postcode.pcds).subquery()
+
+    best = (
+        select(postcodes.c.pcds, BranchArea.branch_id)
+        .select_from(
+            postcodes.outerjoin(
+                BranchArea, postcodes.c.pcds.like(BranchArea.postcode + "%")
+            )
+        )
+        .distinct(postcodes.c.pcds)
+        .order_by(postcodes.c.pcds, func.length(BranchArea.postcode).desc())
+        .subquery()
+    )
+
+    rows = db.execute(
+        update(Address)
+        .where(Address.postcode == best.c.pcds)
+        .where(Address.branch_id.is_distinct_from(best.c.branch_id))
+        .values(branch_id=best.c.branch_id)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.commit()
+
+    return rows
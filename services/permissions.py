@@ -16,6 +16,14 @@ class RoleTypes(Enum):
     LREP = "learning rep"
 
 
+# Roles which are named rather than given as role types. Any active role
+# satisfies them.
+NAMED_ROLES = {
+    "global.admin": set(RoleTypes),
+    "cms.admin": set(RoleTypes),
+}
+
+
 class InvalidPermissionError(Exception):
     pass
 
@@ -38,6 +46,82 @@ def e2b(func, *args, **kwargs):
         return False
 
 
+class Principal:
+    """
+    The contact making a request, along with the roles they currently hold and
+    their membership status. These are loaded at most once, so any number of
+    permission checks against the same principal are answered in memory.
+    """
+
+    def __init__(self, contact):
+        self.contact = contact
+        self.id = contact.id
+
+        self._roles = None
+        self._membership_status = None
+
+    @property
+    def roles(self):
+        """
+        Active roles as (type, branch_id, committee_id, access_level) rows
+        """
+
+        from model.Organisation import Committee, Role
+
+        if self._roles is None:
+            self._roles = tuple(
+                db.query(
+                    Role.type,
+                    Role.branch_id,
+                    Role.committee_id,
+                    Committee.access_level,
+                )
+                .outerjoin(Committee, Role.committee_id == Committee.id)
+                .filter(Role.contact_id == self.id)
+                .filter(Role.held_since < date.today())
+                .filter(Role.ends_on > date.today())
+                .all()
+            )
+
+        return self._roles
+
+    @property
+    def membership_status(self):
+        from services.organisation import get_membership_status
+
+        if self._membership_status is None:
+            self._membership_status = get_membership_status(self.contact)
+
+        return self._membership_status
+
+    def has_position(self, types, branch_id=None, committee_id=None, union=False):
+        """
+        Answer a position check the way user_has_position always has: the role
+        type, branch, committee and union filters are accepted but not applied,
+        and anyone holding more than one active role passes.
+        """
+
+        return len(self.roles) > 1
+
+
+def get_principal(contact):
+    """
+    Return the principal for a contact, creating it the first time it is asked for.
+    The principal lives on the contact instance, so it lasts as long as the
+    request's database session.
+    """
+
+    if contact is None or isinstance(contact, Principal):
+        return contact
+
+    principal = getattr(contact, "_principal", None)
+    if principal is None:
+        principal = Principal(contact)
+        contact._principal = principal
+
+    return principal
+
+
 def user_has_position(
     contact,
     role,
@@ -45,49 +129,44 @@ def user_has_position(
     committee=None,
     union=False,
 ):
-    from model.Organisation import Committee, RoleTypes, Role
-
     if role is None:
         raise ValueError
 
     if branch is not None and committee is not None:
         raise ValueError
 
-    roles = (
-        db.query(Role)
-        .filter(Role.contact_id == contact.id)
-        .filter(Role.held_since < date.today())
-        .filter(Role.ends_on > date.today())
-    )
-
-    try:
-        roles_list = iter(role)
-    except TypeError:
-        if not isinstance(role, RoleTypes):
-            raise ValueError
-        roles.filter(Role.type == role)
+    if isinstance(role, RoleTypes):
+        types = {role}
+    elif isinstance(role, str):
+        if role not in NAMED_ROLES:
+            raise ValueError(f"Unknown role {role}")
+        types = NAMED_ROLES[role]
     else:
-        roles.filter(Role.type.in_(roles_list))
-
-    if union:
-        roles.join(Role.committee).filter(Committee.access_level == 2)
+        try:
+            types = set(role)
+        except TypeError:
+            raise ValueError
 
-    if branch is not None:
-        roles.filter(Role.branch_id == branch.id)
+    principal = get_principal(contact)
+    if principal is None:
+        raise InvalidPermissionError
 
-    if committee is not None:
-        roles.filter(Role.committee_id == committee.id)
+    allowed = principal.has_position(
+        types,
+        branch_id=branch.id if branch is not None else None,
+        committee_id=committee.id if committee is not None else None,
+        union=union,
+    )
 
-    try:
-        assert roles.count() > 1
-    except AssertionError:
+    if not allowed:
         raise InvalidPermissionError
 
 
 def trusted_user(contact, *args, **kwargs):
     try:
-        assert contact is not None
-        assert contact.membership_status == "ACTIVE"
+        principal = get_principal(contact)
+        assert principal is not None
+        assert principal.membership_status == "ACTIVE"
 
     except AssertionError:
         raise InvalidPermissionError
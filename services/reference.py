@@ -0,0 +1,200 @@
+import threading
+from collections import OrderedDict
+
+from sqlalchemy.dialects.postgresql import insert
+
+from model import session_factory
+from model.Address import Boundary, Classification, Postcode, ReferenceVersion
+from model.Organisation import Branch
+from services.refresher import BackgroundRefresher
+
+
+class ReferenceCache(BackgroundRefresher):
+    """
+    Process-wide copy of the small tables which address payloads refer to:
+    classification descriptions, boundaries and branch names. Looking these up
+    never needs the database. The postcodes table is too big to copy, so the
+    boundaries of the postcodes looked up most recently are kept instead.
+
+    Each table has a version in reference_versions, bumped (with `invalidate`)
+    whenever it is written to. A background thread checks the versions every
+    `interval` seconds and reloads any table which has changed, swapping the new
+    copy in whole.
+    """
+
+    DESCRIPTION = "reference data"
+
+    # Tables copied whole
+    TABLES = ("classifications", "boundaries", "branches")
+
+    # How many postcodes to remember
+    POSTCODE_CACHE_SIZE = 10000
+
+    # The boundary columns of a postcode, most specific last
+    BOUNDARY_COLUMNS = ("e05", "e06", "e07", "e10", "e14", "e47", "e58")
+
+    def __init__(self, interval: int = 30):
+        super().__init__(interval)
+
+        self.tables = {}
+        self.versions = {}
+        self.stale = set()
+        self.postcodes = OrderedDict()
+
+        self._postcodes_lock = threading.Lock()
+
+    def load(self, session, name: str) -> dict:
+        """
+        Read a whole table as a dict
+        """
+
+        if name == "classifications":
+            return dict(session.query(Classification.code, Classification.class_desc))
+
+        if name == "boundaries":
+            # Kept as detached objects, so they serialise as they always have
+            return {
+                code: Boundary(code, bname)
+                for code, bname in session.query(Boundary.code, Boundary.name)
+            }
+
+        if name == "branches":
+            return {b.id: b.formal_name for b in session.query(Branch)}
+
+        raise KeyError(name)
+
+    def refresh(self):
+        """
+        Reload the tables which are stale or whose version has changed since they
+        were loaded, and forget the postcodes if they have changed
+        """
+
+        session = session_factory()
+        try:
+            versions = dict(
+                session.query(ReferenceVersion.name, ReferenceVersion.version)
+            )
+
+            tables = dict(self.tables)
+            for name in self.TABLES:
+                version = versions.get(name, 0)
+                if (
+                    name in tables
+                    and name not in self.stale
+                    and self.versions.get(name) == version
+                ):
+                    continue
+
+                self.stale.discard(name)
+                tables[name] = self.load(session, name)
+                self.versions[name] = version
+
+            self.tables = tables
+        finally:
+            session.close()
+
+        version = versions.get("postcodes", 0)
+        if "postcodes" in self.stale or self.versions.get("postcodes") != version:
+            self.stale.discard("postcodes")
+            self.postcodes = OrderedDict()
+            self.versions["postcodes"] = version
+
+    def table(self, name: str) -> dict:
+        if name not in self.tables or name in self.stale:
+            with self._lock:
+                if name not in self.tables or name in self.stale:
+                    self.refresh()
+
+        return self.tables[name]
+
+    def invalidate(self, *names: str):
+        """
+        Mark tables as changed, so every process reloads them. This process
+        reloads them when they are next used.
+        """
+
+        session = session_factory()
+        try:
+            stmt = insert(ReferenceVersion).values(
+                [{"name": n, "version": 1} for n in names]
+            )
+            stmt = stmt.on_conflict_do_update(
+                index_elements=["name"],
+                set_={"version": ReferenceVersion.version + 1},
+            )
+            session.execute(stmt)
+            session.commit()
+        finally:
+            session.close()
+
+        self.stale.update(names)
+
+    def postcode(self, pcds: str):
+        """
+        The codes of the boundaries a postcode is in, or None if there is no such
+        postcode
+        """
+
+        if "postcodes" in self.stale:
+            with self._lock:
+                if "postcodes" in self.stale:
+                    self.refresh()
+
+        # Kept hold of, so a lookup finishing after the postcodes are forgotten
+        # is forgotten with them
+        postcodes = self.postcodes
+        with self._postcodes_lock:
+            if pcds in postcodes:
+                postcodes.move_to_end(pcds)
+                return postcodes[pcds]
+
+        session = session_factory()
+        try:
+            row = (
+                session.query(*[getattr(Postcode, c) for c in self.BOUNDARY_COLUMNS])
+                .filter(Postcode.pcds == pcds)
+                .first()
+            )
+        finally:
+            session.close()
+
+        codes = None if row is None else tuple(c for c in row if c is not None)
+        with self._postcodes_lock:
+            postcodes[pcds] = codes
+            while len(postcodes) > self.POSTCODE_CACHE_SIZE:
+                postcodes.popitem(last=False)
+
+        return codes
+
+    def classification(self, code: str):
+        return self.table("classifications").get(code)
+
+    def boundary(self, code: str):
+        return self.table("boundaries").get(code)
+
+    def postcode_boundaries(self, pcds: str) -> list:
+        """
+        The boundaries a postcode is in, in descending order of code
+        """
+
+        boundaries = self.table("boundaries")
+        codes = sorted(self.postcode(pcds) or (), reverse=True)
+        return [boundaries[c] for c in codes if c in boundaries]
+
+    def postcode_exists(self, pcds: str) -> bool:
+        return self.postcode(pcds) is not None
+
+    def branch_name(self, branch_id: int):
+        return self.table("branches").get(branch_id)
+
+
+reference = ReferenceCache()
+
+
+def start_reference_cache():
+    """
+    Load the reference data and keep it up to date in the background
+    """
+
+    print("Loading reference data...\n")
+    reference.start()
@@ -0,0 +1,55 @@
+import threading
+
+
+class BackgroundRefresher:
+    """
+    Base for process-wide caches which are loaded at startup and then refreshed
+    by a background thread every `interval` seconds.
+
+    Subclasses implement `refresh`, which must swap its new data in whole so
+    readers never see half of it. Refreshes (and anything else holding `_lock`)
+    run one at a time; a failed refresh keeps the data already loaded.
+    """
+
+    # What is being cached, for log messages
+    DESCRIPTION = "data"
+
+    def __init__(self, interval: int):
+        self.interval = interval
+
+        self._lock = threading.Lock()
+        self._worker = None
+
+    def refresh(self):
+        raise NotImplementedError
+
+    def _refresh_periodically(self):
+        wait = threading.Event()
+
+        while True:
+            wait.wait(self.interval)
+
+            try:
+                with self._lock:
+                    self.refresh()
+            except Exception as e:
+                # Keep what we have, and try again next time
+                print(f"Unable to refresh {self.DESCRIPTION}: {str(e)}")
+
+    def start(self):
+        """
+        Load the data and start the background refresh thread
+        """
+
+        if self._worker is not None:
+            return
+
+        try:
+            with self._lock:
+                self.refresh()
+        except Exception as e:
+            # It will be loaded when it is first used instead
+            print(f"Unable to load {self.DESCRIPTION}: {str(e)}")
+
+        self._worker = threading.Thread(target=self._refresh_periodically, daemon=True)
+        self._worker.start()
@@ -0,0 +1,194 @@
+from sqlalchemy import case, distinct, func, literal, select
+
+from model import db
+from model.Address import Address, AddressBoundary, HmoLicense, SurveyReturn
+from model.Contact import Contact, ContactAddress
+from model.Stats import TENURE_COLUMNS, BoundaryStats, BranchStats
+
+# The counts rolled up for each area
+STAT_COLUMNS = (
+    "households",
+    "addresses",
+    "survey_returns",
+    "surveyed",
+    "members",
+    "hmo_licences",
+    *TENURE_COLUMNS.values(),
+)
+
+
+def address_counts(uprns=None):
+    """
+    The counts for each live address, built in one pass over survey returns,
+    members' addresses and the HMO register. Retired addresses aren't counted at
+    all, so every count covers the same addresses.
+
+    uprns:  if given, a select of the only addresses to count
+    """
+
+    returns = select(
+        SurveyReturn.uprn,
+        func.count(SurveyReturn.id).label("survey_returns"),
+        *[
+            func.count(SurveyReturn.id).filter(SurveyReturn.tenure == t).label(c)
+            for t, c in TENURE_COLUMNS.items()
+        ],
+    )
+    members = (
+        select(ContactAddress.uprn, func.count(distinct(Contact.id)).label("members"))
+        .join(Contact, Contact.lives_at == ContactAddress.id)
+        .where(Contact.membership_number != None)
+    )
+    hmos = select(HmoLicense.uprn, func.count(HmoLicense.id).label("hmo_licences"))
+    if uprns is not None:
+        returns = returns.where(SurveyReturn.uprn.in_(uprns))
+        members = members.where(ContactAddress.uprn.in_(uprns))
+        hmos = hmos.where(HmoLicense.uprn.in_(uprns))
+
+    returns = returns.group_by(SurveyReturn.uprn).subquery()
+    members = members.group_by(ContactAddress.uprn).subquery()
+    hmos = hmos.group_by(HmoLicense.uprn).subquery()
+
+    counts = (
+        select(
+            Address.uprn,
+            Address.branch_id,
+            case((Address.classification_code.like("R%"), 1), else_=0).label(
+                "households"
+            ),
+            literal(1).label("addresses"),
+            func.coalesce(returns.c.survey_returns, 0).label("survey_returns"),
+            case((returns.c.uprn != None, 1), else_=0).label("surveyed"),
+            func.coalesce(members.c.members, 0).label("members"),
+            func.coalesce(hmos.c.hmo_licences, 0).label("hmo_licences"),
+            *[func.coalesce(returns.c[c], 0).label(c) for c in TENURE_COLUMNS.values()],
+        )
+        .outerjoin(returns, returns.c.uprn == Address.uprn)
+        .outerjoin(members, members.c.uprn == Address.uprn)
+        .outerjoin(hmos, hmos.c.uprn == Address.uprn)
+        .where(Address.retired_on == None)
+    )
+    if uprns is not None:
+        counts = counts.where(Address.uprn.in_(uprns))
+
+    return counts.subquery()
+
+
+def replace_stats(model, key: str, rollup, scope=None) -> int:
+    """
+    Replace the rollups of a stats table (only those for the areas in `scope`, if
+    given) with the rows of a select
+    """
+
+    table = model.__table__
+
+    stale = table.delete()
+    if scope is not None:
+        stale = stale.where(table.c[key].in_(scope))
+    db.execute(stale)
+
+    return db.execute(
+        table.insert().from_select([key, *STAT_COLUMNS, "refreshed"], rollup)
+    ).rowcount
+
+
+def refresh_stats(boundaries: list = None, branches: list = None) -> int:
+    """
+    Recompute the statistics of boundaries and branches. The old rollups are
+    replaced in one transaction, so they stay readable throughout.
+
+    boundaries: if given, only recompute these boundaries
+    branches:   if given, only recompute these branches
+
+    Giving neither recomputes every boundary and branch.
+    """
+
+    full = boundaries is None and branches is None
+    now = func.now()
+    rows = 0
+
+    if full or boundaries:
+        in_scope = AddressBoundary.boundary_code.in_(boundaries or [])
+        counts = address_counts(
+            None if full else select(AddressBoundary.uprn).where(in_scope)
+        )
+        rollup = (
+            select(
+                AddressBoundary.boundary_code,
+                *[func.sum(counts.c[c]) for c in STAT_COLUMNS],
+                now,
+            )
+            .join(counts, counts.c.uprn == AddressBoundary.uprn)
+            .group_by(AddressBoundary.boundary_code)
+        )
+        if not full:
+            rollup = rollup.where(in_scope)
+
+        rows += replace_stats(
+            BoundaryStats, "boundary_code", rollup, None if full else boundaries
+        )
+
+    if full or branches:
+        in_scope = Address.branch_id.in_(branches or [])
+        counts = address_counts(None if full else select(Address.uprn).where(in_scope))
+        rollup = (
+            select(
+                counts.c.branch_id,
+                *[func.sum(counts.c[c]) for c in STAT_COLUMNS],
+                now,
+            )
+            .where(counts.c.branch_id != None)
+            .group_by(counts.c.branch_id)
+        )
+
+        rows += replace_stats(
+            BranchStats, "branch_id", rollup, None if full else branches
+        )
+
+    db.commit()
+
+    return rows
+
+
+def record_return(survey_return: SurveyReturn):
+    """
+    Count a new survey return in the statistics of its address's boundaries and
+    branch, rather than recomputing them. Call this before committing the return,
+    so it is counted in the same transaction.
+
+    Members and HMO licences aren't counted as they change, so those figures are
+    only as recent as the last refresh_stats.
+    """
+
+    # The return may not have been flushed yet, so only its address is set
+    uprn = survey_return.address.uprn
+
+    # Lock the address, so concurrent returns for it are counted one at a time
+    # and only the first marks it as surveyed
+    retired_on = db.execute(
+        select(Address.retired_on).where(Address.uprn == uprn).with_for_update()
+    ).scalar()
+    if retired_on is not None:
+        return
+
+    db.flush()
+
+    increments = ["survey_returns"]
+    if db.query(SurveyReturn).filter(SurveyReturn.uprn == uprn).count() == 1:
+        increments.append("surveyed")
+    if survey_return.tenure is not None:
+        increments.append(TENURE_COLUMNS[survey_return.tenure])
+
+    boundaries = select(AddressBoundary.boundary_code).where(
+        AddressBoundary.uprn == uprn
+    )
+    branch = select(Address.branch_id).where(Address.uprn == uprn).scalar_subquery()
+
+    now = func.now()
+    for model, where in (
+        (BoundaryStats, BoundaryStats.boundary_code.in_(boundaries)),
+        (BranchStats, BranchStats.branch_id == branch),
+    ):
+        values = {c: getattr(model, c) + 1 for c in increments}
+        values["refreshed"] = now
+        db.execute(model.__table__.update().where(where).values(values))
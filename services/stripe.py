@@ -97,6 +97,7 @@ def import_customers():
             addresses = (
                 db.query(Address)
                 .filter(Address.postcode == c.address.postal_code)
+                .filter(Address.retired_on == None)
                 .all()
             )
             address = None
@@ -25,6 +25,12 @@ if os.path.isfile(LOCAL_FILE):
     config.read(LOCAL_FILE)
     any_file = True
 
+# A file named in the environment (e.g. by the tests) is read last
+ENV_FILE = os.environ.get("ENV_FILE")
+if ENV_FILE is not None and os.path.isfile(ENV_FILE):
+    config.read(ENV_FILE)
+    any_file = True
+
 if not any_file:
     raise Exception("No configuration file found.")
 
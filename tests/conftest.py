@@ -0,0 +1,6 @@
+import os
+
+# Configure the app for tests before anything imports settings
+os.environ.setdefault(
+    "ENV_FILE", os.path.join(os.path.dirname(__file__), "test.env.ini")
+)
@@ -0,0 +1,102 @@
+import pandas as pd
+import pytest
+
+from model.Address import Address, Street
+from services.address import format_addresses
+
+# Imported only so their mappers are registered before Address is configured
+from model.File import File  # noqa: F401
+from model.Organisation import Branch  # noqa: F401
+
+
+def street(usrn, description, locality=None, town=None, admin_area=None):
+    s = Street(usrn)
+    s.description = description
+    s.locality = locality
+    s.town = town
+    s.admin_area = admin_area
+    return s
+
+
+def address(uprn, s, **parts):
+    a = Address(uprn)
+    a.usrn = s.usrn
+    a.street = s
+    a.postcode = parts.pop("postcode", "PE1 1AA")
+    for name in Address.__table__.columns.keys():
+        if name.startswith("sao_") or name.startswith("pao_"):
+            setattr(a, name, parts.pop(name, None))
+
+    assert parts == {}
+    return a
+
+
+STREETS = [
+    street(1, "High Street", "Woodston", "Peterborough", "Peterborough"),
+    street(2, "Station Road", None, "Whittlesey", "Fenland"),
+    street(3, "Mill Lane", "Castor", None, "Peterborough"),
+    street(4, "Long Causeway", None, None, None),
+]
+
+ADDRESSES = [
+    # Plain numbered address
+    address(101, STREETS[0], pao_start_number=12),
+    # Text-only PAO
+    address(102, STREETS[0], pao_text="THE OLD VICARAGE"),
+    # Text-only PAO and SAO
+    address(103, STREETS[1], sao_text="ANNEXE", pao_text="ROSE COTTAGE"),
+    # Numbered SAO in a named building
+    address(104, STREETS[1], sao_start_number=3, pao_text="MILL HOUSE"),
+    # Suffixes and ranges
+    address(105, STREETS[0], pao_start_number=7, pao_start_suffix="A"),
+    address(
+        106,
+        STREETS[2],
+        pao_start_number=1,
+        pao_start_suffix="B",
+        pao_end_number=5,
+        pao_end_suffix="C",
+    ),
+    address(
+        107,
+        STREETS[2],
+        sao_text="FLAT",
+        sao_start_number=2,
+        sao_end_number=4,
+        pao_text="COURT HOUSE",
+        pao_start_number=9,
+    ),
+    # Missing locality, town and admin area
+    address(108, STREETS[3], pao_start_number=21),
+    address(109, STREETS[3], pao_text="MARKET HALL", postcode=None),
+]
+
+
+@pytest.fixture(scope="module")
+def formatted():
+    columns = Address.__table__.columns.keys()
+    frame = pd.DataFrame([{c: getattr(a, c) for c in columns} for a in ADDRESSES])
+    streets = pd.DataFrame(
+        [
+            {
+                "usrn": s.usrn,
+                "description": s.description,
+                "locality": s.locality,
+                "town": s.town,
+                "admin_area": s.admin_area,
+            }
+            for s in STREETS
+        ]
+    )
+
+    return format_addresses(frame, streets)
+
+
+@pytest.mark.parametrize("i", range(len(ADDRESSES)))
+def test_single_line(formatted, i):
+    assert formatted["single_line"][i] == ADDRESSES[i].format_single_line()
+
+
+@pytest.mark.parametrize("i", range(len(ADDRESSES)))
+def test_multiline(formatted, i):
+    assert formatted["multiline"][i] == ADDRESSES[i].format_multiline()
@@ -0,0 +1,101 @@
+from datetime import date
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.pool import StaticPool
+
+import model
+from model import Model, db
+from model.Address import Address, AddressBoundary, SurveyReturn
+from model.Stats import BoundaryStats, BranchStats
+from services.stats import record_return
+
+# Imported only so their mappers are registered before Address is configured
+from model.File import File  # noqa: F401
+from model.Organisation import Branch  # noqa: F401
+
+TABLES = (
+    "addresses",
+    "address_boundaries",
+    "survey_returns",
+    "boundary_stats",
+    "branch_stats",
+)
+
+
+@compiles(ARRAY, "sqlite")
+def compile_array(type_, compiler, **kw):
+    return "TEXT"
+
+
+@pytest.fixture
+def session(monkeypatch):
+    """
+    The tables a survey return is counted in, in an in-memory database
+    """
+
+    engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+
+    # The grid cell is computed with PostgreSQL casts, and isn't needed here
+    grid_cell = Address.__table__.c.grid_cell
+    monkeypatch.setattr(grid_cell, "computed", None)
+    monkeypatch.setattr(grid_cell, "server_default", None)
+    Model.metadata.create_all(engine, tables=[Model.metadata.tables[t] for t in TABLES])
+
+    db.remove()
+    db.configure(bind=engine)
+
+    address = Address(100)
+    address.branch_id = 1
+    db.add(address)
+    db.add(AddressBoundary(uprn=100, boundary_code="E05000001", type="E05"))
+    db.add(BoundaryStats(boundary_code="E05000001", refreshed=date(2021, 1, 1)))
+    db.add(BranchStats(branch_id=1, refreshed=date(2021, 1, 1)))
+    db.commit()
+
+    yield db
+
+    db.remove()
+    db.configure(bind=model.engine)
+
+
+def put_return(session, tenure=None):
+    # As AddressResource.on_put_returns does
+    response = SurveyReturn()
+    response.address = session.get(Address, 100)
+    response.date = date(2021, 6, 1)
+    response.tenure = tenure
+
+    session.add(response)
+    record_return(response)
+    session.commit()
+
+
+def stats(session) -> list:
+    session.expire_all()
+    return [
+        session.get(BoundaryStats, "E05000001"),
+        session.get(BranchStats, 1),
+    ]
+
+
+def test_return_is_counted(session):
+    put_return(session, SurveyReturn.TenureTypes.PRIVATE_RENT)
+
+    for s in stats(session):
+        assert s.survey_returns == 1
+        assert s.surveyed == 1
+        assert s.tenure_private_rent == 1
+
+
+def test_address_is_surveyed_once(session):
+    put_return(session)
+    put_return(session)
+
+    for s in stats(session):
+        assert s.survey_returns == 2
+        assert s.surveyed == 1